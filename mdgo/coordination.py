@@ -2,11 +2,16 @@
 # Copyright (c) Tingzheng Hou.
 # Distributed under the terms of the MIT License.
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 import numpy as np
 from tqdm.notebook import tqdm
 from MDAnalysis.analysis.distances import distance_array
 from scipy.signal import savgol_filter
-from mdgo.util import atom_vec
+from mdgo.util import position_vec_batch
 
 __author__ = "Tingzheng Hou"
 __version__ = "1.0"
@@ -15,29 +20,143 @@ __email__ = "tingzheng_hou@berkeley.edu"
 __date__ = "Feb 9, 2021"
 
 
+def _mic_distances_numpy(ref, points, box):
+    """Returns the minimum image distances between the position ref and each of
+    the points in an orthorhombic box of side lengths box.
+    """
+    vectors = position_vec_batch(points, ref, box)
+    return np.sqrt(np.sum(vectors * vectors, axis=1))
+
+
+# explicit loops are only worth it when compiled by numba
+def _mic_distances_loop(ref, points, box):
+    distances = np.empty(len(points))
+    for i in range(len(points)):
+        squared = 0.0
+        for k in range(3):
+            # in float64 like the numpy version, whatever the precision of the positions
+            side = np.float64(box[k])
+            diff = np.float64(points[i, k]) - np.float64(ref[k])
+            diff -= side * np.rint(diff / side)
+            squared += diff * diff
+        distances[i] = np.sqrt(squared)
+    return distances
+
+
+_mic_distances = njit(cache=True)(_mic_distances_loop) if njit is not None else _mic_distances_numpy
+
+
+def _distances_to(ref, points, dimensions):
+    """Returns the distances between the position ref and each of the points,
+    without the overhead of distance_array when the box is orthorhombic.
+    Without a box (dimensions is None), the plain euclidean distances are returned.
+    """
+    if dimensions is None:
+        return np.linalg.norm(points - ref, axis=1)
+    if np.all(dimensions[3:] == 90):
+        return _mic_distances(ref, points, dimensions[:3])
+    return distance_array(ref, points, dimensions)[0]
+
+
 def trajectory(nvt_run, li_atom, run_start, run_end, species, selection_dict, distance):
-    dist_values = {}
-    time_count = 0
+    """Returns a python dict of the distances between the central atom and each atom of
+    the species that enters its shell (within distance) at any time step.
+
+    The trajectory is read twice: the first pass finds the neighbors and the second
+    records their distances over the whole run. Only the neighbor rows are stored,
+    so the memory is (neighbors × frames) rather than (species atoms × frames).
+    """
     trj_analysis = nvt_run.trajectory[run_start:run_end:]
     if species not in list(selection_dict):
         print("Invalid species selection")
         return None
-    for ts in trj_analysis:
-        selection = (
-            "(" + selection_dict.get(species) + ") and (around " + str(distance) + " index " + str(li_atom.id - 1) + ")"
-        )
-        shell = nvt_run.select_atoms(selection, periodic=True)
-        for atom in shell.atoms:
-            if str(atom.id) not in dist_values:
-                dist_values[str(atom.id)] = np.full(run_end - run_start, 100.0)
-        time_count += 1
-    time_count = 0
-    for ts in trj_analysis:
-        for atomid in dist_values.keys():
-            dist = distance_array(ts[li_atom.id - 1], ts[(int(atomid) - 1)], ts.dimensions)
-            dist_values[atomid][time_count] = dist
-        time_count += 1
-    return dist_values
+    species_atoms = nvt_run.select_atoms(selection_dict.get(species))
+    # same criterion as the "around" selection, which never includes the central atom itself
+    candidates = species_atoms.indices != li_atom.id - 1
+    first_step = np.full(len(species_atoms), run_end - run_start)
+    for time_count, ts in enumerate(trj_analysis):
+        in_shell = _distances_to(ts[li_atom.id - 1], species_atoms.positions, ts.dimensions) <= distance
+        entering = in_shell & candidates & (first_step > time_count)
+        first_step[entering] = time_count
+    neighbor_rows = np.flatnonzero(first_step < run_end - run_start)
+    # keep the order in which the neighbors enter the shell
+    neighbor_rows = neighbor_rows[np.argsort(first_step[neighbor_rows], kind="stable")]
+    neighbors = species_atoms[neighbor_rows]
+    neighbor_matrix = np.full((len(neighbors), run_end - run_start), 100.0)
+    for time_count, ts in enumerate(trj_analysis if len(neighbors) else []):
+        neighbor_matrix[:, time_count] = _distances_to(ts[li_atom.id - 1], neighbors.positions, ts.dimensions)
+    return {str(atom_id): neighbor_matrix[i] for i, atom_id in enumerate(neighbors.ids)}
+
+
+def _smoothed_distances(trj, smooth):
+    # one savgol_filter call over all the rows of the distance matrix
+    return savgol_filter(np.array(list(trj.values())), smooth, 2, axis=1)
+
+
+def _hopping_sites(dist_matrix, nearest, distance, hopping_cutoff):
+    """Returns the row of the binding site (-1 if unbound) on each timestep and
+    the distance to it, given the (N_atoms, T) distance matrix and its per-step argmin.
+    """
+    time_span = dist_matrix.shape[1]
+    site_rows = np.full(time_span, -1, dtype=np.int64)
+    site_distance = np.full(time_span, 100.0)
+    current = nearest[0]
+    site_rows[0] = current
+    site_distance[0] = dist_matrix[current, 0]
+    for time in range(1, time_span):
+        if current == -1:
+            old_site_distance = 100.0
+        else:
+            old_site_distance = dist_matrix[current, time]
+        if old_site_distance > hopping_cutoff:
+            new_site_distance = dist_matrix[nearest[time], time]
+            if new_site_distance > distance:
+                current = -1
+            else:
+                current = nearest[time]
+                site_distance[time] = new_site_distance
+        else:
+            site_distance[time] = old_site_distance
+        site_rows[time] = current
+    return site_rows, site_distance
+
+
+def _hopping_in_out(site_rows, cool):
+    """Returns the hopping in and hopping out timesteps from the binding site rows
+    (-1 if unbound), dropping the pairs separated by less than the cool down steps.
+    """
+    steps_in = np.zeros(len(site_rows), dtype=np.int64)
+    steps_out = np.zeros(len(site_rows), dtype=np.int64)
+    num_in = 0
+    num_out = 0
+    last = site_rows[0]
+    in_cool = cool
+    out_cool = cool
+    for i in range(len(site_rows)):
+        s = site_rows[i]
+        if last == s:
+            pass
+        elif last == -1:
+            in_cool = 0
+            steps_in[num_in] = i
+            num_in += 1
+            if out_cool < cool:
+                num_out -= 1
+        elif s == -1:
+            out_cool = 0
+            steps_out[num_out] = i
+            num_out += 1
+            if in_cool < cool:
+                num_in -= 1
+        last = s
+        in_cool += 1
+        out_cool += 1
+    return steps_in[:num_in], steps_out[:num_out]
+
+
+if njit is not None:
+    _hopping_sites = njit(cache=True)(_hopping_sites)
+    _hopping_in_out = njit(cache=True)(_hopping_in_out)
 
 
 def find_nearest(trj, time_step, distance, hopping_cutoff, smooth=51):
@@ -52,52 +171,20 @@ def find_nearest(trj, time_step, distance, hopping_cutoff, smooth=51):
         hopping_cutoff: (int or float): Detaching cutoff distance.
         smooth (int): The length of the smooth filter window. Default to 51.
     """
-    time_span = len(list(trj.values())[0])
-    for kw in list(trj):
-        trj[kw] = savgol_filter(trj.get(kw), smooth, 2)
-    site_distance = [100 for _ in range(time_span)]
-    sites = [0 for _ in range(time_span)]
-    sites[0] = min(trj, key=lambda k: trj[k][0])
-    site_distance[0] = trj.get(sites[0])[0]
-    for time in range(1, time_span):
-        if sites[time - 1] == 0:
-            old_site_distance = 100
-        else:
-            old_site_distance = trj.get(sites[time - 1])[time]
-        if old_site_distance > hopping_cutoff:
-            new_site = min(trj, key=lambda k: trj[k][time])
-            new_site_distance = trj.get(new_site)[time]
-            if new_site_distance > distance:
-                site_distance[time] = 100
-            else:
-                sites[time] = new_site
-                site_distance[time] = new_site_distance
-        else:
-            sites[time] = sites[time - 1]
-            site_distance[time] = old_site_distance
-    sites = [int(i) for i in sites]
-    sites_and_distance_array = np.array([[sites[i], site_distance[i]] for i in range(len(sites))])
-    steps = []
-    closest_step = 0
-    previous_site = sites_and_distance_array[0][0]
-    for i, step in enumerate(sites_and_distance_array):
-        site = step[0]
-        distance = step[1]
-        if site == 0:
-            pass
-        else:
-            if site == previous_site:
-                if distance < sites_and_distance_array[closest_step][1]:
-                    closest_step = i
-                else:
-                    pass
-            else:
-                steps.append(closest_step)
-                closest_step = i
-                previous_site = site
-    if previous_site is not None:
-        steps.append(closest_step)
-    change = (np.diff([i for i in sites if i != 0]) != 0).sum()
+    # site id 0 is reserved for the unbound steps (row -1)
+    site_ids = np.array([0] + [int(kw) for kw in trj], dtype=np.int64)
+    dist_matrix = _smoothed_distances(trj, smooth)
+    time_span = dist_matrix.shape[1]
+    site_rows, site_distance = _hopping_sites(dist_matrix, np.argmin(dist_matrix, axis=0), distance, hopping_cutoff)
+    sites = site_ids[site_rows + 1]
+    # the unbound steps do not break a run of the same binding site
+    bound_steps = np.flatnonzero(sites)
+    bound_sites = sites[bound_steps]
+    bound_distance = site_distance[bound_steps]
+    run_starts = np.concatenate(([0], np.flatnonzero(np.diff(bound_sites)) + 1))
+    run_ends = np.append(run_starts[1:], len(bound_steps))
+    steps = [int(bound_steps[start + np.argmin(bound_distance[start:end])]) for start, end in zip(run_starts, run_ends)]
+    change = np.count_nonzero(np.diff(bound_sites))
     frequency = change / (time_span * time_step)
     return sites, frequency, steps
 
@@ -112,55 +199,10 @@ def find_in_n_out(trj, distance, hopping_cutoff, smooth=51, cool=20):
         smooth (int): The length of the smooth filter window. Default to 51.
         cool (int): The cool down timesteps between hopping in and hopping out.
     """
-    time_span = len(list(trj.values())[0])
-    for kw in list(trj):
-        trj[kw] = savgol_filter(trj.get(kw), smooth, 2)
-    site_distance = [100 for _ in range(time_span)]
-    sites = [0 for _ in range(time_span)]
-    sites[0] = min(trj, key=lambda k: trj[k][0])
-    site_distance[0] = trj.get(sites[0])[0]
-    for time in range(1, time_span):
-        if sites[time - 1] == 0:
-            old_site_distance = 100
-        else:
-            old_site_distance = trj.get(sites[time - 1])[time]
-        if old_site_distance > hopping_cutoff:
-            new_site = min(trj, key=lambda k: trj[k][time])
-            new_site_distance = trj.get(new_site)[time]
-            if new_site_distance > distance:
-                site_distance[time] = 100
-            else:
-                sites[time] = new_site
-                site_distance[time] = new_site_distance
-        else:
-            sites[time] = sites[time - 1]
-            site_distance[time] = old_site_distance
-    sites = [int(i) for i in sites]
-
-    last = sites[0]
-    steps_in = list()
-    steps_out = list()
-    in_cool = cool
-    out_cool = cool
-    for i, s in enumerate(sites):
-        if last == s:
-            pass
-        elif last == 0:
-            in_cool = 0
-            steps_in.append(i)
-            if out_cool < cool:
-                steps_out.pop()
-        elif s == 0:
-            out_cool = 0
-            steps_out.append(i)
-            if in_cool < cool:
-                steps_in.pop()
-        else:
-            pass
-        last = s
-        in_cool += 1
-        out_cool += 1
-    return steps_in, steps_out
+    dist_matrix = _smoothed_distances(trj, smooth)
+    site_rows, _ = _hopping_sites(dist_matrix, np.argmin(dist_matrix, axis=0), distance, hopping_cutoff)
+    steps_in, steps_out = _hopping_in_out(site_rows, cool)
+    return steps_in.tolist(), steps_out.tolist()
 
 
 def check_contiguous_steps(nvt_run, li_atom, species_dict, select_dict, run_start, run_end, checkpoints, lag=20):
@@ -178,31 +220,26 @@ def check_contiguous_steps(nvt_run, li_atom, species_dict, select_dict, run_star
     """
     coord_num = {x: [[] for _ in range(lag * 2 + 1)] for x in species_dict.keys()}
     trj_analysis = nvt_run.trajectory[run_start:run_end:]
-    has = False
+    shells = {
+        kw: nvt_run.select_atoms(
+            "(" + select_dict[kw] + ") and (around " + str(species_dict[kw]) + " index " + str(li_atom.id - 1) + ")",
+            periodic=True,
+            updating=True,
+        )
+        for kw in species_dict.keys()
+    }
+    # the checkpoint each step belongs to (-1 for none); later checkpoints take precedence on overlap
+    step_checkpoint = np.full(len(trj_analysis), -1, dtype=np.int64)
+    for j in checkpoints:
+        step_checkpoint[max(0, j - lag) : max(0, j + lag + 1)] = j
     for i, ts in enumerate(trj_analysis):
-        log = False
-        checkpoint = None
-        for j in checkpoints:
-            if abs(i - j) <= lag:
-                log = True
-                has = True
-                checkpoint = j
-        if log:
+        checkpoint = step_checkpoint[i]
+        if checkpoint >= 0:
             for kw in species_dict.keys():
-                selection = (
-                    "("
-                    + select_dict[kw]
-                    + ") and (around "
-                    + str(species_dict[kw])
-                    + " index "
-                    + str(li_atom.id - 1)
-                    + ")"
-                )
-                shell = nvt_run.select_atoms(selection, periodic=True)
-                coord_num[kw][i - checkpoint + lag].append(len(shell))
-    if has:
+                coord_num[kw][i - checkpoint + lag].append(len(shells[kw]))
+    if np.any(step_checkpoint >= 0):
         for kw in coord_num:
-            np_arrays = np.array([np.array(time).mean() for time in coord_num[kw]])
+            np_arrays = np.array([np.mean(time) if time else np.nan for time in coord_num[kw]])
             coord_num[kw] = np_arrays
     return coord_num
 
@@ -217,55 +254,42 @@ def heat_map(
     run_start,
     run_end,
 ):
-    trj_analysis = nvt_run.trajectory[run_start:run_end:]
-    coordinates = []
-    for i, ts in enumerate(trj_analysis):
-        if sites[i] == 0:
-            pass
-        else:
-            center_atom = nvt_run.select_atoms("index " + str(sites[i] - 1))[0]
-            selection = (
-                "("
-                + bind_atom_type
-                + ") and "
-                + "(around "
-                + str(dist_to_center)
-                + " index "
-                + str(center_atom.id - 1)
-                + ")"
-            )
-            bind_atoms = nvt_run.select_atoms(selection, periodic=True)
-            distances = distance_array(ts[li_atom.id - 1], bind_atoms.positions, ts.dimensions)
-            idx = np.argpartition(distances[0], 3)
-            vertex_atoms = bind_atoms[idx[:3]]
-            vector_li = atom_vec(li_atom, center_atom, ts.dimensions)
-            vector_a = atom_vec(vertex_atoms[0], center_atom, ts.dimensions)
-            vector_b = atom_vec(vertex_atoms[1], center_atom, ts.dimensions)
-            vector_c = atom_vec(vertex_atoms[2], center_atom, ts.dimensions)
-            basis_abc = np.transpose([vector_a, vector_b, vector_c])
-            abc_li = np.linalg.solve(basis_abc, vector_li)
-            unit_x = np.linalg.norm(
-                cartesian_by_ref[0, 0] * vector_a
-                + cartesian_by_ref[0, 1] * vector_b
-                + cartesian_by_ref[0, 2] * vector_c
-            )
-            unit_y = np.linalg.norm(
-                cartesian_by_ref[1, 0] * vector_a
-                + cartesian_by_ref[1, 1] * vector_b
-                + cartesian_by_ref[1, 2] * vector_c
-            )
-            unit_z = np.linalg.norm(
-                cartesian_by_ref[2, 0] * vector_a
-                + cartesian_by_ref[2, 1] * vector_b
-                + cartesian_by_ref[2, 2] * vector_c
-            )
-            vector_x = cartesian_by_ref[0] / unit_x
-            vector_y = cartesian_by_ref[1] / unit_y
-            vector_z = cartesian_by_ref[2] / unit_z
-            basis_xyz = np.transpose([vector_x, vector_y, vector_z])
-            xyz_li = np.linalg.solve(basis_xyz, abc_li)
-            coordinates.append(xyz_li)
-    return np.array(coordinates)
+    # only visit the frames in which the cation is bound to a site
+    active = np.flatnonzero(np.asarray(sites[: run_end - run_start]) != 0)
+    li_vectors = []
+    vertex_vectors = []
+    for i, ts in zip(active, nvt_run.trajectory[run_start + active]):
+        center_atom = nvt_run.atoms[sites[i] - 1]
+        selection = (
+            "("
+            + bind_atom_type
+            + ") and "
+            + "(around "
+            + str(dist_to_center)
+            + " index "
+            + str(center_atom.id - 1)
+            + ")"
+        )
+        bind_positions = nvt_run.select_atoms(selection, periodic=True).positions
+        distances = _distances_to(ts[li_atom.id - 1], bind_positions, ts.dimensions)
+        vertex_idx = np.argpartition(distances, 3)[:3]
+        # minimum image vectors from the center atom to the cation and the three closest binding atoms
+        vectors = position_vec_batch(
+            np.vstack((ts[li_atom.id - 1], bind_positions[vertex_idx])), center_atom.position, ts.dimensions
+        )
+        li_vectors.append(vectors[0])
+        vertex_vectors.append(vectors[1:])
+    if not li_vectors:
+        return np.empty((0, 3))
+    # solve the 3x3 systems of all the frames at once
+    li_vectors = np.array(li_vectors)[..., np.newaxis]
+    vertex_vectors = np.array(vertex_vectors)
+    basis_abc = np.transpose(vertex_vectors, (0, 2, 1))
+    abc_li = np.linalg.solve(basis_abc, li_vectors)
+    unit_xyz = np.linalg.norm(np.matmul(cartesian_by_ref, vertex_vectors), axis=-1)
+    basis_xyz = np.transpose(cartesian_by_ref / unit_xyz[..., np.newaxis], (0, 2, 1))
+    xyz_li = np.linalg.solve(basis_xyz, abc_li)
+    return xyz_li[..., 0]
 
 
 def get_full_coords(coords, reflection=None, rotation=None, inversion=None, sample=None):
@@ -312,13 +336,10 @@ def cluster_coordinates(
     )
     print(selection)
     shell = nvt_run.select_atoms(selection, periodic=True)
-    cluster = []
-    for atom in shell:
-        coord_list = []
-        for ts in trj_analysis:
-            coord_list.append(atom.position)
-        cluster.append(np.mean(np.array(coord_list), axis=0))
-    cluster = np.array(cluster)
+    cluster = np.zeros((len(shell), 3))
+    for ts in trj_analysis:
+        cluster += shell.positions
+    cluster /= len(trj_analysis)
     if basis_vectors:
         if len(basis_vectors) == 2:
             vec1 = basis_vectors[0]
@@ -367,25 +388,27 @@ def num_of_neighbor_one_li(
             print("Invalid species selection")
             return None
     cn_values["total"] = np.zeros(int(len(trj_analysis)))
+    shells = {
+        kw: nvt_run.select_atoms(
+            "("
+            + select_dict.get(kw)
+            + ") and (around "
+            + str(species_dict.get(kw))
+            + " index "
+            + str(li_atom.id - 1)
+            + ")",
+            periodic=True,
+            updating=True,
+        )
+        for kw in species
+    }
+    # the total is encoded as one decimal digit per species, e.g. 221
+    digit_weights = 10 ** np.arange(len(species) - 1, -1, -1)
     for ts in trj_analysis:
-        digit_of_species = len(species) - 1
-        for kw in species:
-            selection = (
-                "("
-                + select_dict.get(kw)
-                + ") and (around "
-                + str(species_dict.get(kw))
-                + " index "
-                + str(li_atom.id - 1)
-                + ")"
-            )
-            shell = nvt_run.select_atoms(selection, periodic=True)
-            # for each atom in shell, create/add to dictionary
-            # (key = atom id, value = list of values for step function)
-            for _ in shell.atoms:
-                cn_values[kw][time_count] += 1
-                cn_values["total"][time_count] += 10 ** digit_of_species
-            digit_of_species = digit_of_species - 1
+        counts = np.array([len(shells[kw]) for kw in species])
+        for kw, count in zip(species, counts):
+            cn_values[kw][time_count] = count
+        cn_values["total"][time_count] = np.dot(counts, digit_weights)
         if write and cn_values["total"][time_count] == structure_code:
             a = np.random.random()
             if a > 1 - write_freq:
@@ -409,6 +432,44 @@ def num_of_neighbor_one_li(
     return cn_values
 
 
+def num_of_neighbor_all_li(nvt_run, li_atoms, species_dict, select_dict, run_start, run_end):
+    """Returns the coordination numbers of all the cations in the same format as
+    coord_shell_array with num_of_neighbor_one_li, but walks the trajectory only
+    once and counts the neighbors of all the cations from one distance matrix
+    per species on each timestep.
+
+    Args:
+        nvt_run (MDAnalysis.Universe): An Universe object of wrapped trajectory.
+        li_atoms (MDAnalysis.core.groups.AtomGroup): Atom group of the cations.
+        species_dict (dict): A dict of coordination cutoff distance
+            of the interested species.
+        select_dict (dict): A dictionary of selection language of atom species.
+        run_start (int): Start time step.
+        run_end (int): End time step.
+    """
+    trj_analysis = nvt_run.trajectory[run_start:run_end:]
+    species = list(species_dict.keys())
+    for kw in species:
+        if kw not in select_dict.keys():
+            print("Invalid species selection")
+            return None
+    species_atoms = {kw: nvt_run.select_atoms(select_dict.get(kw)) for kw in species}
+    # the "around" selection never counts the central atom itself
+    is_center = {kw: li_atoms.indices[:, np.newaxis] == species_atoms[kw].indices for kw in species}
+    cn_values = {kw: np.zeros((len(li_atoms), int(len(trj_analysis)))) for kw in species}
+    for time_count, ts in enumerate(trj_analysis):
+        for kw in species:
+            in_shell = (
+                distance_array(li_atoms.positions, species_atoms[kw].positions, ts.dimensions) <= species_dict[kw]
+            )
+            in_shell[is_center[kw]] = False
+            cn_values[kw][:, time_count] = in_shell.sum(axis=1)
+    cn_values["total"] = np.zeros((len(li_atoms), int(len(trj_analysis))))
+    for digit_of_species, kw in enumerate(reversed(species)):
+        cn_values["total"] += cn_values[kw] * 10 ** digit_of_species
+    return {kw: cn_values[kw].ravel() for kw in cn_values}
+
+
 def num_of_neighbor_one_li_simple(nvt_run, li_atom, species_dict, select_dict, run_start, run_end):
 
     time_count = 0
@@ -419,17 +480,18 @@ def num_of_neighbor_one_li_simple(nvt_run, li_atom, species_dict, select_dict, r
     else:
         print("Invalid species selection")
         return None
+    shell = nvt_run.select_atoms(
+        "("
+        + select_dict.get(species)
+        + ") and (around "
+        + str(species_dict.get(species))
+        + " index "
+        + str(li_atom.id - 1)
+        + ")",
+        periodic=True,
+        updating=True,
+    )
     for ts in trj_analysis:
-        selection = (
-            "("
-            + select_dict.get(species)
-            + ") and (around "
-            + str(species_dict.get(species))
-            + " index "
-            + str(li_atom.id - 1)
-            + ")"
-        )
-        shell = nvt_run.select_atoms(selection, periodic=True)
         shell_len = len(shell)
         if shell_len == 0:
             cn_values[time_count] = 1
@@ -467,11 +529,15 @@ def num_of_neighbor_one_li_simple_extra(nvt_run, li_atom, species, select_dict,
     else:
         print("Invalid species selection")
         return None
+    shell = nvt_run.select_atoms(
+        "(" + select_dict.get(species) + ") and (around " + str(distance) + " index " + str(li_atom.id - 1) + ")",
+        periodic=True,
+        updating=True,
+    )
+    # only needed for the CIP frames, so selected on first use
+    ec_group = None
+    emc_group = None
     for ts in trj_analysis:
-        selection = (
-            "(" + select_dict.get(species) + ") and (around " + str(distance) + " index " + str(li_atom.id - 1) + ")"
-        )
-        shell = nvt_run.select_atoms(selection, periodic=True)
         shell_len = len(shell)
         if shell_len == 0:
             cn_values[time_count] = 1
@@ -489,22 +555,21 @@ def num_of_neighbor_one_li_simple_extra(nvt_run, li_atom, species, select_dict,
             shell_species_len = len(shell_species) - 1
             if shell_species_len == 0:
                 cn_values[time_count] = 2
+                if ec_group is None:
+                    ec_group = nvt_run.select_atoms(
+                        "(" + select_dict.get("EC") + ") and (around 3 index " + str(li_atom.id - 1) + ")",
+                        periodic=True,
+                        updating=True,
+                    )
+                    emc_group = nvt_run.select_atoms(
+                        "(" + select_dict.get("EMC") + ") and (around 3 index " + str(li_atom.id - 1) + ")",
+                        periodic=True,
+                        updating=True,
+                    )
                 li_pos = li_atom.position
                 p_pos = shell.atoms[0].position
-                ec_select = (
-                    "(" + select_dict.get("EC") + ") and (around " + str(3) + " index " + str(li_atom.id - 1) + ")"
-                )
-                emc_select = (
-                    "(" + select_dict.get("EMC") + ") and (around " + str(3) + " index " + str(li_atom.id - 1) + ")"
-                )
-                ec_group = nvt_run.select_atoms(ec_select, periodic=True)
-                emc_group = nvt_run.select_atoms(emc_select, periodic=True)
-                for atom in ec_group.atoms:
-                    theta = angle(p_pos, li_pos, atom.position)
-                    ec_angle.append(theta)
-                for atom in emc_group.atoms:
-                    theta = angle(p_pos, li_pos, atom.position)
-                    emc_angle.append(theta)
+                ec_angle.extend(angle(p_pos, li_pos, ec_group.positions))
+                emc_angle.extend(angle(p_pos, li_pos, emc_group.positions))
             else:
                 cn_values[time_count] = 3
         else:
@@ -516,9 +581,9 @@ def num_of_neighbor_one_li_simple_extra(nvt_run, li_atom, species, select_dict,
 def num_of_neighbor_one_li_simple_extra_two(nvt_run, li_atom, species_list, select_dict, distances, run_start, run_end):
     time_count = 0
     trj_analysis = nvt_run.trajectory[run_start:run_end:]
-    cip_step = list()
-    ssip_step = list()
-    agg_step = list()
+    cip_mask = np.zeros(len(trj_analysis), dtype=bool)
+    ssip_mask = np.zeros(len(trj_analysis), dtype=bool)
+    agg_mask = np.zeros(len(trj_analysis), dtype=bool)
     cn_values = dict()
     for kw in species_list:
         if kw in select_dict.keys():
@@ -527,39 +592,43 @@ def num_of_neighbor_one_li_simple_extra_two(nvt_run, li_atom, species_list, sele
             print("Invalid species selection")
             return None
     cn_values["total"] = np.zeros(int(len(trj_analysis)))
-    for ts in trj_analysis:
-        digit_of_species = len(species_list) - 1
-        for kw in species_list:
-            selection = (
-                "("
-                + select_dict.get(kw)
-                + ") and (around "
-                + str(distances.get(kw))
-                + " index "
-                + str(li_atom.id - 1)
-                + ")"
-            )
-            shell = nvt_run.select_atoms(selection, periodic=True)
-            # for each atom in shell, create/add to dictionary
-            # (key = atom id, value = list of values for step function)
-            for _ in shell.atoms:
-                cn_values[kw][time_count] += 1
-                cn_values["total"][time_count] += 10 ** digit_of_species
-            digit_of_species = digit_of_species - 1
-
-        selection = (
+    shells = {
+        kw: nvt_run.select_atoms(
             "("
-            + select_dict.get("anion")
+            + select_dict.get(kw)
             + ") and (around "
-            + str(distances.get("anion"))
+            + str(distances.get(kw))
             + " index "
             + str(li_atom.id - 1)
-            + ")"
+            + ")",
+            periodic=True,
+            updating=True,
         )
-        shell = nvt_run.select_atoms(selection, periodic=True)
+        for kw in species_list
+    }
+    anion_shell = nvt_run.select_atoms(
+        "("
+        + select_dict.get("anion")
+        + ") and (around "
+        + str(distances.get("anion"))
+        + " index "
+        + str(li_atom.id - 1)
+        + ")",
+        periodic=True,
+        updating=True,
+    )
+    # the total is encoded as one decimal digit per species, e.g. 221
+    digit_weights = 10 ** np.arange(len(species_list) - 1, -1, -1)
+    for ts in trj_analysis:
+        counts = np.array([len(shells[kw]) for kw in species_list])
+        for kw, count in zip(species_list, counts):
+            cn_values[kw][time_count] = count
+        cn_values["total"][time_count] = np.dot(counts, digit_weights)
+
+        shell = anion_shell
         shell_len = len(shell)
         if shell_len == 0:
-            ssip_step.append(time_count)
+            ssip_mask[time_count] = True
         elif shell_len == 1:
             selection_species = (
                 "("
@@ -573,71 +642,75 @@ def num_of_neighbor_one_li_simple_extra_two(nvt_run, li_atom, species_list, sele
             shell_species = nvt_run.select_atoms(selection_species, periodic=True)
             shell_species_len = len(shell_species) - 1
             if shell_species_len == 0:
-                cip_step.append(time_count)
+                cip_mask[time_count] = True
             else:
-                agg_step.append(time_count)
+                agg_mask[time_count] = True
         else:
-            agg_step.append(time_count)
+            agg_mask[time_count] = True
         time_count += 1
-    cn_ssip = dict()
-    cn_cip = dict()
-    cn_agg = dict()
-    for kw in species_list:
-        cn_ssip[kw] = np.mean(cn_values[kw][ssip_step])
-        cn_cip[kw] = np.mean(cn_values[kw][cip_step])
-        cn_agg[kw] = np.mean(cn_values[kw][agg_step])
+    cn_matrix = np.array([cn_values[kw] for kw in species_list])
+    cn_ssip, cn_cip, cn_agg = (
+        dict(zip(species_list, cn_matrix[:, mask].mean(axis=1))) for mask in (ssip_mask, cip_mask, agg_mask)
+    )
     return cn_ssip, cn_cip, cn_agg
 
 
 def angle(a, b, c):
+    """
+    Calculate the angle a-b-c in degrees. Any of the positions can be
+    an (N, 3) array, in which case an array of N angles is returned.
+    """
     ba = a - b
     bc = c - b
-    cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
+    cosine_angle = np.sum(ba * bc, axis=-1) / (np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1))
     cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
     angle_in_radian = np.arccos(cosine_angle)
     return np.degrees(angle_in_radian)
 
 
-# Depth-first traversal
-def num_of_neighbor_one_li_complex(nvt_run, li_atom, species, selection_dict, distance, run_start, run_end):
-    time_count = 0
+def num_of_neighbor_one_li_complex(
+    nvt_run, li_atom, species, selection_dict, distance, run_start, run_end, contact_distance=3
+):
+    """Returns the number of anions and cations in the first four alternating
+    shells (anion, cation, anion, cation) of the central cation, found by a
+    breadth-first traversal of the cation-anion contacts on each timestep, as a
+    (frames, 4) array. The anions are counted by residue and the cations by atom.
+
+    Args:
+        nvt_run (MDAnalysis.Universe): An Universe object of wrapped trajectory.
+        li_atom (MDAnalysis.core.groups.Atom): the interested central atom object.
+        species (str): The anion species in selection_dict.
+        selection_dict (dict): A dictionary of selection language of atom species,
+            which must include the "cation" selection.
+        distance (int or float): The cutoff distance of the first shell.
+        run_start (int): Start time step.
+        run_end (int): End time step.
+        contact_distance (int or float): The cation-anion contact distance
+            of the outer shells. Default to 3.
+    """
+    for kw in ["cation", species]:
+        if kw not in selection_dict:
+            raise ValueError("No selection of " + kw + " in selection_dict")
     trj_analysis = nvt_run.trajectory[run_start:run_end:]
     cn_values = np.zeros((int(len(trj_analysis)), 4))
-    for ts in trj_analysis:
-        cation_list = [li_atom.id]
-        anion_list = []
-        shell = nvt_run.select_atoms(
-            "(" + selection_dict.get(species) + " and around " + str(distance) + " index " + str(li_atom.id - 1) + ")",
-            periodic=True,
+    cations = nvt_run.select_atoms(selection_dict.get("cation"))
+    anions = nvt_run.select_atoms(selection_dict.get(species))
+    not_center = cations.indices != li_atom.id - 1
+    # anion atoms are counted by residue
+    _, residue_of_atom = np.unique(anions.resids, return_inverse=True)
+    atom_in_residue = np.zeros((len(anions), residue_of_atom.max(initial=-1) + 1), dtype=bool)
+    atom_in_residue[np.arange(len(anions)), residue_of_atom] = True
+    for time_count, ts in enumerate(trj_analysis):
+        center_contact = _distances_to(ts[li_atom.id - 1], anions.positions, ts.dimensions) <= distance
+        contact = np.matmul(
+            distance_array(cations.positions, anions.positions, ts.dimensions) <= contact_distance, atom_in_residue
         )
-        for anion_1 in shell.atoms:
-            if anion_1.resid not in anion_list:
-                anion_list.append(anion_1.resid)
-                cn_values[time_count][0] += 1
-                shell_anion_1 = nvt_run.select_atoms(
-                    "(type 17 and around 3 resid " + str(anion_1.resid) + ")",
-                    periodic=True,
-                )
-                for cation_2 in shell_anion_1:
-                    if cation_2.id not in cation_list:
-                        cation_list.append(cation_2.id)
-                        cn_values[time_count][1] += 1
-                        shell_cation_2 = nvt_run.select_atoms(
-                            "(type 15 and around 3 index " + str(cation_2.id - 1) + ")",
-                            periodic=True,
-                        )
-                        for anion_3 in shell_cation_2.atoms:
-                            if anion_3.resid not in anion_list:
-                                anion_list.append(anion_3.resid)
-                                cn_values[time_count][2] += 1
-                                shell_anion_3 = nvt_run.select_atoms(
-                                    "(type 17 and around 3 resid " + str(anion_3.resid) + ")",
-                                    periodic=True,
-                                )
-                                for cation_4 in shell_anion_3:
-                                    if cation_4.id not in cation_list:
-                                        cation_list.append(cation_4.id)
-                                        cn_values[time_count][3] += 1
+        anion_1 = atom_in_residue[center_contact].any(axis=0)
+        cation_2 = contact[:, anion_1].any(axis=1) & not_center
+        anion_3 = contact[cation_2].any(axis=0) & ~anion_1
+        cation_4 = contact[:, anion_3].any(axis=1) & not_center & ~cation_2
+        cn_values[time_count] = [anion_1.sum(), cation_2.sum(), anion_3.sum(), cation_4.sum()]
+    return cn_values
 
 
 def coord_shell_array(nvt_run, func, li_atoms, species_dict, select_dict, run_start, run_end):
@@ -654,11 +727,12 @@ def coord_shell_array(nvt_run, func, li_atoms, species_dict, select_dict, run_st
         run_end (int): End time step.
     """
     num_array = func(nvt_run, li_atoms[0], species_dict, select_dict, run_start, run_end)
+    num_list = {kw: [num_array[kw]] for kw in num_array}
     for li in tqdm(li_atoms[1::]):
         this_li = func(nvt_run, li, species_dict, select_dict, run_start, run_end)
-        for kw in num_array.keys():
-            num_array[kw] = np.concatenate((num_array.get(kw), this_li.get(kw)), axis=0)
-    return num_array
+        for kw in num_list:
+            num_list[kw].append(this_li.get(kw))
+    return {kw: np.concatenate(num_list[kw], axis=0) for kw in num_list}
 
 
 def write_out(li_pos, selection, element_id_dict, path):
@@ -666,20 +740,10 @@ def write_out(li_pos, selection, element_id_dict, path):
     lines.append(str(len(selection) + 1))
     lines.append("")
     lines.append("Li 0.0000000 0.0000000 0.0000000")
-    box = selection.dimensions
-    half_box = np.array([box[0], box[1], box[2]]) / 2
-    for atom in selection:
-        locs = list()
-        for i in range(3):
-            loc = atom.position[i] - li_pos[i]
-            if loc > half_box[i]:
-                loc = loc - box[i]
-            elif loc < -half_box[i]:
-                loc = loc + box[i]
-            else:
-                pass
-            locs.append(loc)
-        line = element_id_dict.get(int(atom.type)) + " " + " ".join(str(loc) for loc in locs)
+    # written with the precision of the positions
+    locs = position_vec_batch(selection.positions, li_pos, selection.dimensions).astype(selection.positions.dtype)
+    for atom_type, loc in zip(selection.types, locs):
+        line = element_id_dict.get(int(atom_type)) + " " + " ".join(str(x) for x in loc)
         lines.append(line)
     with open(path, "w") as xyz_file:
         xyz_file.write("\n".join(lines))
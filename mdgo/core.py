@@ -23,6 +23,7 @@ from mdgo.conductivity import calc_cond, conductivity_calculator
 from mdgo.coordination import (
     coord_shell_array,
     num_of_neighbor_one_li,
+    num_of_neighbor_all_li,
     num_of_neighbor_one_li_simple,
     trajectory,
     find_nearest,
@@ -315,9 +316,8 @@ class MdRun:
         nvt_run = self.wrapped_run
         species_dict = {species: distance}
         li_atoms = nvt_run.select_atoms(self.select_dict.get("cation"))
-        num_array = coord_shell_array(
+        num_array = num_of_neighbor_all_li(
             nvt_run,
-            num_of_neighbor_one_li,
             li_atoms,
             species_dict,
             self.select_dict,
@@ -341,9 +341,8 @@ class MdRun:
         """
         nvt_run = self.wrapped_run
         li_atoms = nvt_run.select_atoms(self.select_dict.get("cation"))
-        num_array = coord_shell_array(
+        num_array = num_of_neighbor_all_li(
             nvt_run,
-            num_of_neighbor_one_li,
             li_atoms,
             species_dict,
             self.select_dict,
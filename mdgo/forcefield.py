@@ -25,24 +25,24 @@ For using the MaestroRunner class:
 
 from pymatgen.io.lammps.data import LammpsData
 from mdgo.util import mass_to_name, ff_parser, sdf_to_pdb
-import pubchempy as pcp
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import (
-    TimeoutException,
-    NoSuchElementException,
-    WebDriverException,
-)
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from string import Template
+from types import SimpleNamespace
+from urllib.error import HTTPError, URLError
 from urllib.parse import quote
+from urllib.request import urlopen
+import copy
+import glob
+import json
 import time
 import os
 import re
 import shutil
 import signal
 import subprocess
+import sys
+import tempfile
 import numpy as np
 
 from typing import Optional
@@ -54,8 +54,17 @@ __maintainer__ = "Tingzheng Hou"
 __email__ = "tingzheng_hou@berkeley.edu"
 __date__ = "Feb 9, 2021"
 
-MAESTRO: Final[str] = "$SCHRODINGER/maestro -console -nosplash"
-FFLD: Final[str] = "$SCHRODINGER/utilities/ffld_server -imae {} -version 14 -print_parameters -out_file {}"
+MAESTRO: Final[list] = ["$SCHRODINGER/maestro", "-console", "-nosplash"]
+FFLD: Final[list] = [
+    "$SCHRODINGER/utilities/ffld_server",
+    "-imae",
+    "{mae}",
+    "-version",
+    "14",
+    "-print_parameters",
+    "-out_file",
+    "{out}",
+]
 MolecularWeight: Final[str] = "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/cid/{}/property/MolecularWeight/txt"
 MODULE_DIR: Final[str] = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR: Final[str] = os.path.join(MODULE_DIR, "data")
@@ -77,6 +86,64 @@ DATA_MODELS: Final[dict] = {
     },
     "alias": {"aq": "aqvist", "jj": "jensen_jorgensen", "jc": "joung_cheatham"},
 }
+_WATER_NAME_SEPARATOR = re.compile(r"[\W|_]+")
+# the data directory of each ion model, keyed by its name or alias
+_ION_MODEL_NAMES = {name: DATA_MODELS["alias"].get(name, name) for name in DATA_MODELS["ion"]}
+
+
+@lru_cache(maxsize=None)
+def _load_data_model(file_path):
+    return LammpsData.from_file(file_path)
+
+
+def _get_data_model(file_path):
+    # a copy of the cached data file, so the callers can modify what they get
+    return copy.deepcopy(_load_data_model(file_path))
+
+
+@lru_cache(maxsize=None)
+def _read_template(file_path):
+    with open(file_path, "r") as f:
+        return f.read()
+
+
+def _command(template, **files):
+    # only the executable is taken from the environment, the file names are filled in as they are
+    return [os.path.expandvars(template[0])] + [arg.format(**files) for arg in template[1:]]
+
+
+@lru_cache(maxsize=None)
+def _selenium():
+    # selenium is slow to import, so it is only loaded by the browser based classes
+    from selenium import webdriver
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    return SimpleNamespace(
+        webdriver=webdriver,
+        By=By,
+        EC=EC,
+        WebDriverWait=WebDriverWait,
+        NoSuchElementException=NoSuchElementException,
+        TimeoutException=TimeoutException,
+        WebDriverException=WebDriverException,
+    )
+
+
+def _selenium_error(name):
+    # the selenium exception to catch, or nothing if no browser was used and selenium was never imported
+    if "selenium" not in sys.modules:
+        return ()
+    return getattr(_selenium(), name)
+
+
+def _not_found_error(e):
+    return ValueError(
+        "Executable {} not found, please check that $SCHRODINGER "
+        "(currently {!r}) points to the Schrodinger installation.".format(e.filename, os.environ.get("SCHRODINGER"))
+    )
 
 
 class FFcrawler:
@@ -100,19 +167,34 @@ class FFcrawler:
 
         >>> lpg = FFcrawler('/path/to/work/dir', '/path/to/chromedriver')
         >>> lpg.data_from_pdb("/path/to/pdb")
+
+        Used as a context manager, the browser session is kept open for
+        several structures and closed on exit:
+
+        >>> with FFcrawler('/path/to/work/dir', '/path/to/chromedriver') as lpg:
+        ...     lpg.data_from_pdb("/path/to/pdb1")
+        ...     lpg.data_from_pdb("/path/to/pdb2")
+
+        Several structures can be processed concurrently:
+
+        >>> FFcrawler.data_from_pdbs('/path/to/work/dir', ["/path/to/pdb1", "/path/to/pdb2"], '/path/to/chromedriver')
     """
 
     def __init__(self, write_dir, chromedriver_dir=None, headless=True, xyz=False, gromacs=False):
         """Base constructor."""
+        selenium = _selenium()
+
         self.write_dir = write_dir
         self.xyz = xyz
         self.gromacs = gromacs
+        # a single request closes the browser, unless it is managed by a with block
+        self.keep_open = False
         self.preferences = {
             "download.default_directory": write_dir,
             "safebrowsing.enabled": "false",
             "profile.managed_default_content_settings.images": 2,
         }
-        self.options = webdriver.ChromeOptions()
+        self.options = selenium.webdriver.ChromeOptions()
         self.options.add_argument(
             'user-agent="Mozilla/5.0 '
             "(Macintosh; Intel Mac OS X 10_14_6) "
@@ -125,17 +207,29 @@ class FFcrawler:
         self.options.add_experimental_option("prefs", self.preferences)
         self.options.add_experimental_option("excludeSwitches", ["enable-automation"])
         if chromedriver_dir is None:
-            self.web = webdriver.Chrome(options=self.options)
+            self.web = selenium.webdriver.Chrome(options=self.options)
         else:
-            self.web = webdriver.Chrome(chromedriver_dir, options=self.options)
-        self.wait = WebDriverWait(self.web, 10)
+            self.web = selenium.webdriver.Chrome(chromedriver_dir, options=self.options)
+        self.wait = selenium.WebDriverWait(self.web, 10)
         self.web.get("http://zarbi.chem.yale.edu/ligpargen/")
-        time.sleep(1)
+        self.wait.until(selenium.EC.presence_of_element_located((selenium.By.XPATH, '//*[@id="exampleMOLFile"]')))
         print("LigParGen server connected.")
 
+    def __enter__(self):
+        self.keep_open = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.quit()
+
     def quit(self):
         self.web.quit()
 
+    def reset(self):
+        """Clear the state of the previous request and load the LigParGen server page."""
+        self.web.delete_all_cookies()
+        self.web.get("http://zarbi.chem.yale.edu/ligpargen/")
+
     def data_from_pdb(self, pdb_dir):
         """
         Use the LigParGen server to generate a LAMMPS data file from a pdb file.
@@ -145,21 +239,56 @@ class FFcrawler:
 
         Write out a LAMMPS data file.
         """
-        self.web.get("http://zarbi.chem.yale.edu/ligpargen/")
-        time.sleep(1)
-        upload = self.web.find_element_by_xpath('//*[@id="exampleMOLFile"]')
+        selenium = _selenium()
+
+        self.reset()
+        upload = self.wait.until(
+            selenium.EC.presence_of_element_located((selenium.By.XPATH, '//*[@id="exampleMOLFile"]'))
+        )
         try:
             upload.send_keys(pdb_dir)
             submit = self.web.find_element_by_xpath("/html/body/div[2]/div/div[2]/form/button[1]")
             submit.click()
             pdb_filename = os.path.basename(pdb_dir)
             self.download_data(os.path.splitext(pdb_filename)[0] + ".lmp")
-        except TimeoutException:
+        except selenium.TimeoutException:
             print("Timeout! Web server no response for 10s, file download failed!")
-        except WebDriverException as e:
+        except selenium.WebDriverException as e:
             print(e)
         finally:
-            self.quit()
+            if not self.keep_open:
+                self.quit()
+
+    @classmethod
+    def data_from_pdbs(cls, write_dir, pdb_dirs, chromedriver_dir=None, n_workers=4, **kwargs):
+        """
+        Use the LigParGen server to generate LAMMPS data files from a list of
+        pdb files, running one browser session per worker concurrently.
+        Each session is reused for all the files of its worker.
+
+        Args:
+            write_dir (str): Directory for writing output.
+            pdb_dirs (list): The paths to the input pdb structure files.
+            chromedriver_dir (str): Directory to the ChromeDriver executable.
+            n_workers (int): Number of concurrent browser sessions. Default to 4.
+            **kwargs: Other arguments (headless, xyz, gromacs) of FFcrawler.
+
+        Write out the LAMMPS data files.
+        """
+
+        def crawl(pdb_chunk):
+            with cls(write_dir, chromedriver_dir, **kwargs) as lpg:
+                for pdb_dir in pdb_chunk:
+                    lpg.data_from_pdb(pdb_dir)
+
+        if n_workers < 1:
+            raise ValueError("n_workers must be at least 1, got {}".format(n_workers))
+        n_workers = min(n_workers, len(pdb_dirs))
+        if n_workers == 0:
+            return
+        chunks = [pdb_dirs[i::n_workers] for i in range(n_workers)]
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(crawl, chunks))
 
     def data_from_smiles(self, smiles_code):
         """
@@ -171,18 +300,20 @@ class FFcrawler:
 
         Write out a LAMMPS data file.
         """
-        self.web.get("http://zarbi.chem.yale.edu/ligpargen/")
-        time.sleep(1)
-        smile = self.web.find_element_by_xpath('//*[@id="smiles"]')
+        selenium = _selenium()
+
+        self.reset()
+        smile = self.wait.until(selenium.EC.presence_of_element_located((selenium.By.XPATH, '//*[@id="smiles"]')))
         smile.send_keys(smiles_code)
         submit = self.web.find_element_by_xpath("/html/body/div[2]/div/div[2]/form/button[1]")
         submit.click()
         try:
             self.download_data(smiles_code + ".lmp")
-        except TimeoutException:
+        except selenium.TimeoutException:
             print("Timeout! Web server no response for 10s, file download failed!")
         finally:
-            self.quit()
+            if not self.keep_open:
+                self.quit()
 
     def download_data(self, lmp_name):
         """
@@ -191,47 +322,39 @@ class FFcrawler:
         Arg:
             lmp_name (str): Name of the LAMMPS data file.
         """
+        selenium = _selenium()
+
         print("Structure info uploaded. Rendering force field...")
-        self.wait.until(EC.presence_of_element_located((By.NAME, "go")))
-        data_lmp = self.web.find_element_by_xpath("/html/body/div[2]/div[2]/div[1]/div/div[14]/form/input[1]")
-        data_lmp.click()
-        print("Force field file downloaded.")
-        time.sleep(1)
-        lmp_file = max(
-            [self.write_dir + "/" + f for f in os.listdir(self.write_dir) if os.path.splitext(f)[1] == ".lmp"],
-            key=os.path.getctime,
-        )
-        if self.xyz:
-            data_obj = LammpsData.from_file(lmp_file)
-            element_id_dict = mass_to_name(data_obj.masses)
-            coords = data_obj.atoms[["type", "x", "y", "z"]]
-            lines = list()
-            lines.append(str(len(coords.index)))
-            lines.append("")
-            for _, r in coords.iterrows():
-                line = element_id_dict.get(int(r["type"])) + " " + " ".join(str(r[loc]) for loc in ["x", "y", "z"])
-                lines.append(line)
-
-            with open(os.path.join(self.write_dir, lmp_name + ".xyz"), "w") as xyz_file:
-                xyz_file.write("\n".join(lines))
-            print(".xyz file saved.")
-        if self.gromacs:
-            data_gro = self.web.find_element_by_xpath("/html/body/div[2]/div[2]/div[1]/div/div[8]/form/input[1]")
-            data_itp = self.web.find_element_by_xpath("/html/body/div[2]/div[2]/div[1]/div/div[9]/form/input[1]")
-            data_gro.click()
-            data_itp.click()
-            time.sleep(1)
-            gro_file = max(
-                [self.write_dir + "/" + f for f in os.listdir(self.write_dir) if os.path.splitext(f)[1] == ".gro"],
-                key=os.path.getctime,
-            )
-            itp_file = max(
-                [self.write_dir + "/" + f for f in os.listdir(self.write_dir) if os.path.splitext(f)[1] == ".itp"],
-                key=os.path.getctime,
-            )
-            shutil.move(gro_file, os.path.join(self.write_dir, lmp_name[:-4] + ".gro"))
-            shutil.move(itp_file, os.path.join(self.write_dir, lmp_name[:-4] + ".itp"))
-        shutil.move(lmp_file, os.path.join(self.write_dir, lmp_name))
+        self.wait.until(selenium.EC.presence_of_element_located((selenium.By.NAME, "go")))
+        # download into a fresh directory, so each requested file is the only one of its type there
+        download_dir = tempfile.mkdtemp(dir=os.path.abspath(self.write_dir))
+        self.web.execute_cdp_cmd("Page.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir})
+        try:
+            data_lmp = self.web.find_element_by_xpath("/html/body/div[2]/div[2]/div[1]/div/div[14]/form/input[1]")
+            data_lmp.click()
+            # unfinished downloads carry a .crdownload suffix, so the glob only matches complete files
+            lmp_file = self.wait.until(lambda _: glob.glob(os.path.join(download_dir, "*.lmp")))[0]
+            print("Force field file downloaded.")
+            if self.xyz:
+                data_obj = LammpsData.from_file(lmp_file)
+                element_id_dict = mass_to_name(data_obj.masses)
+                coords = data_obj.atoms[["type", "x", "y", "z"]].assign(type=lambda df: df["type"].map(element_id_dict))
+                with open(os.path.join(self.write_dir, lmp_name + ".xyz"), "w", buffering=1 << 20) as xyz_file:
+                    xyz_file.write(str(len(coords.index)) + "\n\n")
+                    np.savetxt(xyz_file, coords.to_numpy(), fmt="%s")
+                print(".xyz file saved.")
+            if self.gromacs:
+                data_gro = self.web.find_element_by_xpath("/html/body/div[2]/div[2]/div[1]/div/div[8]/form/input[1]")
+                data_itp = self.web.find_element_by_xpath("/html/body/div[2]/div[2]/div[1]/div/div[9]/form/input[1]")
+                data_gro.click()
+                data_itp.click()
+                gro_file = self.wait.until(lambda _: glob.glob(os.path.join(download_dir, "*.gro")))[0]
+                itp_file = self.wait.until(lambda _: glob.glob(os.path.join(download_dir, "*.itp")))[0]
+                shutil.move(gro_file, os.path.join(self.write_dir, lmp_name[:-4] + ".gro"))
+                shutil.move(itp_file, os.path.join(self.write_dir, lmp_name[:-4] + ".itp"))
+            shutil.move(lmp_file, os.path.join(self.write_dir, lmp_name))
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
         print("Force field file saved.")
 
 
@@ -303,13 +426,9 @@ class MaestroRunner:
             self.cmd_template = cmd_template
         else:
             if assign_bond:
-                with open(self.template_assignbond, "r") as f:
-                    cmd_template = f.read()
-                self.cmd_template = cmd_template
+                self.cmd_template = _read_template(self.template_assignbond)
             else:
-                with open(self.template_noassignbond, "r") as f:
-                    cmd_template = f.read()
-                self.cmd_template = cmd_template
+                self.cmd_template = _read_template(self.template_noassignbond)
 
     def get_mae(self):
         """Write a Maestro command script and execute it to generate a
@@ -320,38 +439,49 @@ class MaestroRunner:
             f.write(cmd_script)
         try:
             p = subprocess.Popen(
-                f"{MAESTRO} -c {self.cmd}",
-                shell=True,
-                stdout=subprocess.PIPE,
+                _command(MAESTRO) + ["-c", self.cmd],
+                stdout=subprocess.DEVNULL,
                 stderr=subprocess.PIPE,
                 preexec_fn=os.setsid,
             )
-
-            counter = 0
+        except FileNotFoundError as e:
+            raise _not_found_error(e)
+        try:
+            # Maestro stays open after exporting the files, so wait on the
+            # output file rather than the process, but stop as soon as it dies.
+            deadline = time.monotonic() + 30
             while not os.path.isfile(self.mae + ".mae"):
-                time.sleep(1)
-                counter += 1
-                if counter > 30:
-                    raise TimeoutError("Failed to generate Maestro file in 30 secs!")
+                try:
+                    p.wait(timeout=0.1)
+                except subprocess.TimeoutExpired:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError("Failed to generate Maestro file in 30 secs!")
+                else:
+                    if not os.path.isfile(self.mae + ".mae"):
+                        raise subprocess.CalledProcessError(p.returncode, p.args, stderr=p.stderr.read())
             print("Maestro file generated.")
 
         except subprocess.CalledProcessError as e:
             raise ValueError("Maestro failed with errorcode {}  and stderr: {}".format(e.returncode, e.stderr))
         finally:
-            os.killpg(os.getpgid(p.pid), signal.SIGTERM)
+            try:
+                os.killpg(p.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
 
     def get_ff(self):
         """Read the Maestro file and save the force field as LAMMPS data file."""
         try:
             subprocess.run(
-                FFLD.format(self.mae + ".mae", self.ff),
+                _command(FFLD, mae=self.mae + ".mae", out=self.ff),
                 check=True,
-                shell=True,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
             )
         except subprocess.CalledProcessError as e:
             raise ValueError("Maestro failed with errorcode {} and stderr: {}".format(e.returncode, e.stderr))
+        except FileNotFoundError as e:
+            raise _not_found_error(e)
         print("Maestro force field file generated.")
         if self.out:
             if self.out == "lmp":
@@ -379,6 +509,7 @@ class PubChemRunner:
         >>> web = PubChemRunner('/path/to/work/dir', '/path/to/chromedriver')
         >>> long_name, short_name = "ethylene carbonate", "PC"
         >>> cid = web.obtain_entry(long_name, short_name)
+        >>> weights = web.molecular_weights([7303, 7924])
     """
 
     def __init__(
@@ -391,33 +522,50 @@ class PubChemRunner:
         """Base constructor."""
         self.write_dir = write_dir
         self.api = api
-        if not self.api:
-            self.preferences = {
-                "download.default_directory": write_dir,
-                "safebrowsing.enabled": "false",
-                "profile.managed_default_content_settings.images": 2,
-            }
-            self.options = webdriver.ChromeOptions()
-            self.options.add_argument(
-                'user-agent="Mozilla/5.0 '
-                "(Macintosh; Intel Mac OS X 10_14_6) "
-                "AppleWebKit/537.36 (KHTML, like Gecko) "
-                'Chrome/88.0.4324.146 Safari/537.36"'
-            )
-            self.options.add_argument("--window-size=1920,1080")
-            if headless:
-                self.options.add_argument("--headless")
-            self.options.add_experimental_option("prefs", self.preferences)
-            self.options.add_experimental_option("excludeSwitches", ["enable-automation"])
-            self.web = webdriver.Chrome(chromedriver_dir, options=self.options)
-            self.wait = WebDriverWait(self.web, 10)
-            self.web.get("https://pubchem.ncbi.nlm.nih.gov/")
-            time.sleep(1)
-            print("PubChem server connected.")
+        # the CIDs found by previous name searches in this directory
+        self.cid_cache_file = os.path.join(write_dir, ".pubchem_cache.json")
+        if os.path.isfile(self.cid_cache_file):
+            with open(self.cid_cache_file, "r") as f:
+                self.cid_cache = json.load(f)
+        else:
+            self.cid_cache = dict()
+        self.chromedriver_dir = chromedriver_dir
+        self.headless = headless
+        # the browser is only started for the searches PUG REST cannot answer
+        self.web = None
+
+    def _connect(self):
+        if self.web is not None:
+            return
+        selenium = _selenium()
+
+        self.preferences = {
+            "download.default_directory": self.write_dir,
+            "safebrowsing.enabled": "false",
+            "profile.managed_default_content_settings.images": 2,
+        }
+        self.options = selenium.webdriver.ChromeOptions()
+        self.options.add_argument(
+            'user-agent="Mozilla/5.0 '
+            "(Macintosh; Intel Mac OS X 10_14_6) "
+            "AppleWebKit/537.36 (KHTML, like Gecko) "
+            'Chrome/88.0.4324.146 Safari/537.36"'
+        )
+        self.options.add_argument("--window-size=1920,1080")
+        if self.headless:
+            self.options.add_argument("--headless")
+        self.options.add_experimental_option("prefs", self.preferences)
+        self.options.add_experimental_option("excludeSwitches", ["enable-automation"])
+        self.web = selenium.webdriver.Chrome(self.chromedriver_dir, options=self.options)
+        self.wait = selenium.WebDriverWait(self.web, 10)
+        self.web.get("https://pubchem.ncbi.nlm.nih.gov/")
+        self.wait.until(selenium.EC.presence_of_element_located((selenium.By.TAG_NAME, "body")))
+        print("PubChem server connected.")
 
     def quit(self):
-        if not self.api:
+        if self.web is not None:
             self.web.quit()
+            self.web = None
 
     def obtain_entry(self, search_text, name, output_format="sdf"):
         """
@@ -435,71 +583,89 @@ class PubChemRunner:
         else:
             return self._obtain_entry_web(search_text, name, output_format=output_format)
 
+    def molecular_weights(self, cids):
+        """
+        Retrieve the molecular weights of several compounds with a single
+        PUG REST request.
+
+        Args:
+            cids (list): The PubChem IDs of the compounds.
+
+        Returns:
+            dict: The molecular weight of each compound, keyed by its PubChem ID.
+        """
+        if len(cids) == 0:
+            return dict()
+        import pubchempy as pcp
+
+        # pubchempy sends a list of CIDs in the body of one POST request
+        properties = pcp.get_properties("MolecularWeight", [int(cid) for cid in cids])
+        return {int(p["CID"]): float(p["MolecularWeight"]) for p in properties}
+
     def smiles_to_pdb(self, smiles):
+        selenium = _selenium()
+
         convertor_url = "https://cactus.nci.nih.gov/translate/"
         input_xpath = "/html/body/div/div[2]/div[1]/form/table[1]/tbody/tr[2]/td[1]/input[1]"
         pdb_xpath = "/html/body/div/div[2]/div[1]/form/table[1]/tbody/tr[2]/td[2]/div/input[4]"
         translate_xpath = "/html/body/div/div[2]/div[1]/form/table[2]/tbody/tr/td/input[2]"
         download_xpath = "/html/body/center/b/a"
+        self._connect()
         self.web.get(convertor_url)
         self.web.find_element_by_xpath(input_xpath).clear()
         self.web.find_element_by_xpath(input_xpath).send_keys(smiles)
         self.web.find_element_by_xpath(pdb_xpath).click()
         self.web.find_element_by_xpath(translate_xpath).click()
-        time.sleep(1)
-        self.web.find_element_by_xpath(download_xpath).click()
+        pdb_files = set(glob.glob(os.path.join(self.write_dir, "*.pdb")))
+        self.wait.until(selenium.EC.element_to_be_clickable((selenium.By.XPATH, download_xpath))).click()
         print("Waiting for downloads.", end="")
-        time.sleep(1)
-        while any([filename.endswith(".crdownload") for filename in os.listdir(self.write_dir)]):
-            time.sleep(1)
+        # the download has started once its partial or complete file is there
+        self.wait.until(
+            lambda _: self._downloading() or set(glob.glob(os.path.join(self.write_dir, "*.pdb"))) - pdb_files
+        )
+        while self._downloading():
+            time.sleep(0.2)
             print(".", end="")
         print("\nStructure file saved.")
 
+    def _downloading(self):
+        # scandir stops at the first unfinished download without listing the whole directory
+        with os.scandir(self.write_dir) as entries:
+            return any(entry.name.endswith(".crdownload") for entry in entries)
+
     def _obtain_entry_web(self, search_text, name, output_format):
         cid = None
 
         try:
-            query = quote(search_text)
-            url = "https://pubchem.ncbi.nlm.nih.gov/#query=" + query
-            self.web.get(url)
-            time.sleep(1)
-            best_xpath = '//*[@id="featured-results"]/div/div[2]' "/div/div[1]/div[2]/div[1]/a/span/span"
-            relevant_xpath = (
-                '//*[@id="collection-results-container"]'
-                "/div/div/div[2]/ul/li[1]/div/div/div[1]"
-                "/div[2]/div[1]/a/span/span"
-            )
-            if EC.presence_of_element_located((By.XPATH, best_xpath)):
-                match = self.web.find_element_by_xpath(best_xpath)
-            else:
-                match = self.web.find_element_by_xpath(relevant_xpath)
-            match.click()
-            # density_locator = '//*[@id="Density"]/div[2]/div[1]/p'
-            cid_locator = '//*[@id="main-content"]/div/div/div[1]/' "div[3]/div/table/tbody/tr[1]/td"
-            smiles_locator = '//*[@id="Canonical-SMILES"]/div[2]/div[1]/p'
-            self.wait.until(EC.presence_of_element_located((By.XPATH, cid_locator)))
-            cid = self.web.find_element_by_xpath(cid_locator).text
-            smiles = self.web.find_element_by_xpath(smiles_locator).text
+            try:
+                cid, smiles = self._search_rest(search_text)
+            except (OSError, ValueError, KeyError, IndexError):
+                # the name is not known to PUG REST, or the request timed out or
+                # returned no property table: fall back to the search page
+                cid, smiles = self._search_page(search_text)
             print("Best match found, PubChem ID:", cid)
             if output_format.lower() == "smiles":
                 print("SMILES code:", smiles)
             elif output_format.lower() == "pdb":
                 self.smiles_to_pdb(smiles)
             else:
-                self.web.get(
+                url = (
                     f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/CID/"
-                    f"{cid}/record/{output_format.upper()}/?record_type=3d&"
-                    f'response_type=save&response_basename={name + "_" + cid}'
+                    f"{cid}/record/{output_format.upper()}/?record_type=3d"
                 )
-                print("Waiting for downloads.", end="")
-                time.sleep(1)
-                while any([filename.endswith(".crdownload") for filename in os.listdir(self.write_dir)]):
-                    time.sleep(1)
-                    print(".", end="")
-                print("\nStructure file saved.")
-        except TimeoutException:
+                structure_file = os.path.join(self.write_dir, name + "_" + cid + "." + output_format.lower())
+                try:
+                    with urlopen(url, timeout=10) as response, open(structure_file, "wb") as f:
+                        shutil.copyfileobj(response, f, 1 << 20)
+                except (HTTPError, URLError) as e:
+                    if os.path.isfile(structure_file):
+                        os.remove(structure_file)
+                    print("Structure request failed ({}), file download failed!".format(e))
+                else:
+                    print("Structure file saved.")
+        except _selenium_error("TimeoutException"):
             print("Timeout! Web server no response for 10s, file download failed!")
-        except NoSuchElementException:
+        except _selenium_error("NoSuchElementException"):
             print(
                 "The download link was not correctly generated, "
                 "file download failed!\n"
@@ -509,13 +675,63 @@ class PubChemRunner:
             self.quit()
         return cid
 
+    @staticmethod
+    def _search_rest(search_text):
+        url = (
+            "https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/"
+            + quote(search_text, safe="")
+            + "/property/CanonicalSMILES/JSON"
+        )
+        with urlopen(url, timeout=10) as response:
+            properties = json.load(response)["PropertyTable"]["Properties"][0]
+        # newer PUG REST versions report the canonical SMILES as ConnectivitySMILES,
+        # a record without either is a miss like an unknown name
+        smiles = properties.get("CanonicalSMILES") or properties["ConnectivitySMILES"]
+        return str(properties["CID"]), smiles
+
+    def _search_page(self, search_text):
+        selenium = _selenium()
+
+        query = quote(search_text)
+        url = "https://pubchem.ncbi.nlm.nih.gov/#query=" + query
+        self._connect()
+        self.web.get(url)
+        best_xpath = '//*[@id="featured-results"]/div/div[2]' "/div/div[1]/div[2]/div[1]/a/span/span"
+        relevant_xpath = (
+            '//*[@id="collection-results-container"]'
+            "/div/div/div[2]/ul/li[1]/div/div/div[1]"
+            "/div[2]/div[1]/a/span/span"
+        )
+        self.wait.until(
+            selenium.EC.presence_of_element_located((selenium.By.XPATH, best_xpath + " | " + relevant_xpath))
+        )
+        if selenium.EC.presence_of_element_located((selenium.By.XPATH, best_xpath)):
+            match = self.web.find_element_by_xpath(best_xpath)
+        else:
+            match = self.web.find_element_by_xpath(relevant_xpath)
+        match.click()
+        # density_locator = '//*[@id="Density"]/div[2]/div[1]/p'
+        cid_locator = '//*[@id="main-content"]/div/div/div[1]/' "div[3]/div/table/tbody/tr[1]/td"
+        smiles_locator = '//*[@id="Canonical-SMILES"]/div[2]/div[1]/p'
+        self.wait.until(selenium.EC.presence_of_element_located((selenium.By.XPATH, cid_locator)))
+        cid = self.web.find_element_by_xpath(cid_locator).text
+        smiles = self.web.find_element_by_xpath(smiles_locator).text
+        return cid, smiles
+
     def _obtain_entry_api(self, search_text, name, output_format):
-        cid = None
-        cids = pcp.get_cids(search_text, "name", record_type="3d")
-        if len(cids) == 0:
+        import pubchempy as pcp
+
+        cid = self.cid_cache.get(search_text)
+        if cid is None:
+            cids = pcp.get_cids(search_text, "name", record_type="3d")
+            if len(cids) > 0:
+                cid = str(cids[0])
+                self.cid_cache[search_text] = cid
+                with open(self.cid_cache_file, "w") as f:
+                    json.dump(self.cid_cache, f, indent=2)
+        if cid is None:
             print("No exact match found, please try the web search")
         else:
-            cid = str(cids[0])
             if output_format.lower() == "smiles":
                 compound = pcp.Compound.from_cid(int(cid))
                 print("SMILES code:", compound.canonical_smiles)
@@ -561,9 +777,9 @@ class Aqueous:
                 If you specify an invalid water model, None is returned.
         """
         data_path = DATA_DIR
-        signature = "".join(re.split(r"[\W|_]+", model)).lower()
+        signature = "".join(_WATER_NAME_SEPARATOR.split(model)).lower()
         if DATA_MODELS["water"].get(signature):
-            return LammpsData.from_file(os.path.join(data_path, "water", DATA_MODELS["water"].get(signature)))
+            return _get_data_model(os.path.join(data_path, "water", DATA_MODELS["water"].get(signature)))
         else:
             print("Water model not found. Please specify a customized data path or try another water model.\n")
             return None
@@ -586,29 +802,24 @@ class Aqueous:
                 for the given ion is not available, None is returned.
         """
         data_path = DATA_DIR
-        alias = DATA_MODELS.get("alias", {})
-        signature = model.lower()
-        if signature in alias:
-            signature = alias.get(model)
+        signature = _ION_MODEL_NAMES.get(model.lower())
         ion_type = ion.capitalize()
-        for key in DATA_MODELS["ion"].keys():
-            if key.startswith(signature):
-                ion_model = DATA_MODELS["ion"].get(key)
-                if water in ion_model:
-                    if water == "default":
-                        file_path = os.path.join(data_path, "ion", key, ion_type + ".lmp")
-                    else:
-                        file_path = os.path.join(data_path, "ion", key, water, ion_type + ".lmp")
-                    if os.path.exists(file_path):
-                        return LammpsData.from_file(file_path)
-                    else:
-                        print("Ion not found. Please try another ion.\n")
-                        return None
-                else:
-                    print("Water model not found. Please try another water model.\n")
-                    return None
-        print("Ion model not found. Please try another ion model.\n")
-        return None
+        if signature is None:
+            print("Ion model not found. Please try another ion model.\n")
+            return None
+        ion_model = DATA_MODELS["ion"].get(signature)
+        if water not in ion_model:
+            print("Water model not found. Please try another water model.\n")
+            return None
+        if water == "default":
+            file_path = os.path.join(data_path, "ion", signature, ion_type + ".lmp")
+        else:
+            file_path = os.path.join(data_path, "ion", signature, water, ion_type + ".lmp")
+        if os.path.exists(file_path):
+            return _get_data_model(file_path)
+        else:
+            print("Ion not found. Please try another ion.\n")
+            return None
 
 
 class ChargeWriter:
@@ -625,16 +836,15 @@ class ChargeWriter:
         items = dict()
         items["box"] = self.data.box
         items["masses"] = self.data.masses
-        atoms = self.data.atoms.copy(deep=True)
-        atoms["q"] = atoms["q"] * factor
-        assert np.around(atoms.q.sum(), decimals=self.precision) == np.around(
+        # scale the bare charge array and write it into one copy of the atoms frame
+        new_q = self.data.atoms["q"].to_numpy() * factor
+        atoms = self.data.atoms.copy()
+        atoms["q"] = new_q
+        assert np.around(new_q.sum(), decimals=self.precision) == np.around(
             self.data.atoms.q.sum() * factor, decimals=self.precision
         )
-        digit_count = 0
-        for q in atoms["q"]:
-            rounded = self.count_significant_figures(q)
-            if rounded > digit_count:
-                digit_count = rounded
+        # the charges repeat over the atoms of each type, so only the distinct values are counted
+        digit_count = max((self.count_significant_figures(q) for q in np.unique(new_q)), default=0)
         print("No. of significant figures to output for charges: ", digit_count)
         items["atoms"] = atoms
         items["atom_style"] = self.data.atom_style
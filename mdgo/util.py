@@ -8,8 +8,9 @@ from io import StringIO
 import os
 import re
 import pandas as pd
-import math
 import sys
+from collections import defaultdict
+from functools import lru_cache
 from typing import List, Dict, Union, Tuple
 from typing_extensions import Final
 from mdgo.volume import molecular_volume
@@ -23,6 +24,9 @@ __maintainer__ = "Tingzheng Hou"
 __email__ = "tingzheng_hou@berkeley.edu"
 __date__ = "Feb 9, 2021"
 
+_DIGITS_RE = re.compile(r"\d+")
+_WORD_RE = re.compile(r"\w+")
+
 MM_of_Elements: Final[Dict[str, float]] = {
     "H": 1.00794,
     "He": 4.002602,
@@ -145,6 +149,10 @@ MM_of_Elements: Final[Dict[str, float]] = {
     "ZERO": 0,
 }
 
+# MM_of_Elements as aligned arrays for vectorized lookups
+_ELEMENT_NAMES = np.array(list(MM_of_Elements), dtype=object)
+_ELEMENT_MASSES = np.fromiter(MM_of_Elements.values(), dtype=np.float64, count=len(MM_of_Elements))
+
 SECTION_SORTER: Final[Dict[str, dict]] = {
     "atoms": {
         "in_kw": None,
@@ -285,32 +293,63 @@ def atom_vec(atom1, atom2, dimension):
     """
     Calculate the vector of the positions from atom2 to atom1.
     """
-    vec = [0, 0, 0]
-    for i in range(3):
-        diff = atom1.position[i] - atom2.position[i]
-        if diff > dimension[i] / 2:
-            vec[i] = diff - dimension[i]
-        elif diff < -dimension[i] / 2:
-            vec[i] = diff + dimension[i]
-        else:
-            vec[i] = diff
-    return np.array(vec)
+    return position_vec(atom1.position, atom2.position, dimension)
+
+
+def atom_vecs(atoms1, atoms2, dimension):
+    """
+    Calculate the vectors of the positions from atoms2 to atoms1 pairwise,
+    the batched version of atom_vec.
+
+    Args:
+        atoms1 (MDAnalysis.AtomGroup or list): N atoms.
+        atoms2 (MDAnalysis.AtomGroup or list): N atoms, or a single atom.
+        dimension (array-like): The box lengths.
+    Return:
+        numpy.ndarray: An (N, 3) array of vectors.
+    """
+    return position_vec_batch(_positions(atoms1), _positions(atoms2), dimension)
+
+
+def _positions(atoms):
+    """
+    Gather the positions of an AtomGroup, a sequence of atoms or a single atom
+    into one float64 array.
+    """
+    if hasattr(atoms, "positions"):
+        return np.asarray(atoms.positions, dtype=np.float64)
+    if hasattr(atoms, "position"):
+        return np.asarray(atoms.position, dtype=np.float64)
+    return np.array([atom.position for atom in atoms], dtype=np.float64).reshape(-1, 3)
 
 
 def position_vec(pos1, pos2, dimension):
     """
-    Calculate the vector from pos2 to pos2.
+    Calculate the vector from pos2 to pos1.
     """
-    vec = [0, 0, 0]
-    for i in range(3):
-        diff = pos1[i] - pos2[i]
-        if diff > dimension[i] / 2:
-            vec[i] = diff - dimension[i]
-        elif diff < -dimension[i] / 2:
-            vec[i] = diff + dimension[i]
-        else:
-            vec[i] = diff
-    return np.array(vec)
+    return position_vec_batch(np.reshape(pos1, (1, 3)), np.reshape(pos2, (1, 3)), dimension)[0]
+
+
+def position_vec_batch(pos1, pos2, dimension):
+    """
+    Calculate the minimum image vectors from the positions in pos2 to the
+    positions in pos1.
+
+    Args:
+        pos1 (numpy.ndarray): An (N, 3) array of positions.
+        pos2 (numpy.ndarray): An (N, 3) or (3,) array of positions.
+        dimension (array-like): The box lengths. Only the first three
+            elements are used, so ts.dimensions can be passed directly.
+    Return:
+        numpy.ndarray: An (N, 3) array of vectors.
+    """
+    box = np.asarray(dimension[:3], dtype=np.float64)
+    vec = np.subtract(pos1, pos2, dtype=np.float64)
+    shift = np.divide(vec, box)
+    np.rint(shift, out=shift)
+    shift *= box
+    vec -= shift
+    return vec
 
 
 def mass_to_name(df):
@@ -322,12 +361,11 @@ def mass_to_name(df):
     Return:
         dict: The element dict.
     """
-    atoms = {}
-    for row in df.index:
-        for item in MM_of_Elements.items():
-            if math.isclose(df["mass"][row], item[1], abs_tol=0.01):
-                atoms[row] = item[0]
-    return atoms
+    masses = df["mass"].to_numpy(dtype=np.float64)
+    matched = np.abs(masses[:, np.newaxis] - _ELEMENT_MASSES) <= 0.01
+    # the last matching element in MM_of_Elements wins
+    last_match = len(_ELEMENT_NAMES) - 1 - np.argmax(matched[:, ::-1], axis=1)
+    return {row: _ELEMENT_NAMES[i] for row, i, found in zip(df.index, last_match, matched.any(axis=1)) if found}
 
 
 def assign_name(u, element_id_dict):
@@ -375,19 +413,19 @@ def res_dict_from_select_dict(u, select_dict):
     return:
         dict: A dictionary of resnames.
     """
-    saved_select = list()
+    # selections are cached by string and compared by their atom indices, in order
+    res_groups = dict()
+    saved_select = set()
     res_dict = dict()
     for key, val in select_dict.items():
         res_select = "same resid as (" + val + ")"
-        res_group = u.select_atoms(res_select)
+        if res_select not in res_groups:
+            res_groups[res_select] = tuple(u.select_atoms(res_select).ix)
+        res_group = res_groups[res_select]
         if key in ["cation", "anion"] or res_group not in saved_select:
-            saved_select.append(res_group)
+            saved_select.add(res_group)
             res_dict[key] = res_select
-    if (
-        "cation" in res_dict
-        and "anion" in res_dict
-        and u.select_atoms(res_dict.get("cation")) == u.select_atoms(res_dict.get("anion"))
-    ):
+    if "cation" in res_dict and "anion" in res_dict and res_groups[res_dict["cation"]] == res_groups[res_dict["anion"]]:
         res_dict.pop("anion")
         res_dict["salt"] = res_dict.pop("cation")
     return res_dict
@@ -406,7 +444,7 @@ def res_dict_from_datafile(filename):
     with open(filename, "r") as f:
         lines = f.readlines()
         if lines[0] == "Generated by pymatgen.io.lammps.data.LammpsData\n" and lines[1].startswith("#"):
-            elyte_info = re.findall(r"\w+", lines[1])
+            elyte_info = _WORD_RE.findall(lines[1])
             it = iter(elyte_info)
             idx = 1
             for num in it:
@@ -439,28 +477,18 @@ def res_dict_from_lammpsdata(lammps_data):
         dict: A dictionary of resnames.
     """
     assert isinstance(lammps_data, CombinedData)
-    idx = 1
     res_dict = dict()
-
-    if hasattr(lammps_data, "frags"):
-        for name, num, frag in zip(lammps_data.names, lammps_data.nums, lammps_data.frags):
-            if frag == 1:
-                start = idx
-                idx += num
-                end = idx
-                res_dict[name] = "resid " + str(start) + "-" + str(end - 1)
-            else:
-                names = [name + c for c in string.ascii_lowercase[0:frag]]
-                start = idx
-                idx += int(num) * frag
-                for i, n in enumerate(names):
-                    res_dict[n] = "same mass as resid " + str(start + i)
-    else:
-        for name, num in zip(lammps_data.names, lammps_data.nums):
-            start = idx
-            idx += num
-            end = idx
-            res_dict[name] = "resid " + str(start) + "-" + str(end - 1)
+    nums = np.asarray(lammps_data.nums, dtype=int)
+    frags = np.asarray(getattr(lammps_data, "frags", np.ones_like(nums)), dtype=int)
+    # the first resid of each species follows all the residues before it
+    counts = nums * frags
+    starts = np.cumsum(counts) - counts + 1
+    for name, num, frag, start in zip(lammps_data.names, nums.tolist(), frags.tolist(), starts.tolist()):
+        if frag == 1:
+            res_dict[name] = "resid " + str(start) + "-" + str(start + num - 1)
+        else:
+            for i, c in enumerate(string.ascii_lowercase[0:frag]):
+                res_dict[name + c] = "same mass as resid " + str(start + i)
     return res_dict
 
 
@@ -499,30 +527,29 @@ def select_dict_from_resname(u):
 
 
 def extract_atom_from_ion(positive, residue, select_dict):
-    if positive:
-        if len(residue.atoms.types) == 1:
-            select_dict["cation"] = "type " + residue.atoms.types[0]
-        else:
-            pos_center = residue.atoms[np.argmax(residue.atoms.charges)]
-            unique_types = np.unique(residue.atoms.types, return_counts=True)
-            uni_center = unique_types[0][np.argmin(unique_types[1])]
-            if pos_center.type == uni_center:
-                select_dict["cation"] = "type " + uni_center
-            else:
-                select_dict["cation_" + pos_center.name + pos_center.type] = "type " + pos_center.type
-                select_dict["cation"] = "type " + uni_center
+    ion = "cation" if positive else "anion"
+    if len(residue.atoms.types) == 1:
+        select_dict[ion] = "type " + residue.atoms.types[0]
     else:
-        if len(residue.atoms.types) == 1:
-            select_dict["anion"] = "type " + residue.atoms.types[0]
-        else:
-            neg_center = residue.atoms[np.argmin(residue.atoms.charges)]
-            unique_types = np.unique(residue.atoms.types, return_counts=True)
-            uni_center = unique_types[0][np.argmin(unique_types[1])]
-            if neg_center.type == uni_center:
-                select_dict["anion"] = "type " + uni_center
-            else:
-                select_dict["anion_" + neg_center.name + neg_center.type] = "type " + neg_center.type
-                select_dict["anion"] = "type " + uni_center
+        uni_center, center_type, center_name = _ion_centers(
+            positive,
+            tuple(residue.atoms.types),
+            tuple(residue.atoms.names),
+            tuple(residue.atoms.charges.tolist()),
+        )
+        if center_type != uni_center:
+            select_dict[ion + "_" + center_name + center_type] = "type " + center_type
+        select_dict[ion] = "type " + uni_center
+
+
+@lru_cache(maxsize=32)
+def _ion_centers(positive, types, names, charges):
+    # identical ions share the same types, names and charges, so they are only analyzed once;
+    # a system has a handful of ion species, so a small cache is enough
+    center = np.argmax(charges) if positive else np.argmin(charges)
+    unique_types = np.unique(types, return_counts=True)
+    uni_center = unique_types[0][np.argmin(unique_types[1])]
+    return uni_center, types[center], names[center]
 
 
 def extract_atom_from_molecule(resname, residue, select_dict):
@@ -534,6 +561,35 @@ def extract_atom_from_molecule(resname, residue, select_dict):
     select_dict[resname] = "type " + neg_center.type
 
 
+@lru_cache(maxsize=None)
+def _atom_name_to_mass(name):
+    # the element symbol is the part of the atom name before the first digit
+    return MM_of_Elements.get(_DIGITS_RE.split(name, 1)[0])
+
+
+def _table_string(df, columns, float_format="%.10g"):
+    """
+    Format the index and the given columns of a DataFrame as lines of single space
+    separated values with np.savetxt, which is much faster than DataFrame.to_string.
+    The floats keep up to 10 significant digits by default.
+    """
+    fmt = ["%d"] + ["%d" if pd.api.types.is_integer_dtype(df[col]) else float_format for col in columns]
+    table = StringIO()
+    np.savetxt(table, np.column_stack((df.index.to_numpy(), df[columns].to_numpy())), fmt=fmt)
+    return table.getvalue().rstrip("\n")
+
+
+def _section_frame(section_str, names, usecols):
+    """
+    Read the whitespace separated columns of a force field section with np.loadtxt,
+    keeping the atom name columns as strings and the parameters as floats.
+    """
+    table = np.loadtxt(StringIO(section_str), dtype=str, comments=None, usecols=usecols, ndmin=2)
+    return pd.DataFrame(
+        {name: col if name.startswith("atom") else col.astype(float) for name, col in zip(names, table.T)}
+    )
+
+
 def ff_parser(ff_dir, xyz_dir):
     """
     A parser to convert a force field field from Maestro format
@@ -546,7 +602,7 @@ def ff_parser(ff_dir, xyz_dir):
         str: The output LAMMPS data string.
     """
     with open(xyz_dir, "r") as f_xyz:
-        molecule = pd.read_table(f_xyz, skiprows=2, delim_whitespace=True, names=["atom", "x", "y", "z"])
+        molecule = pd.read_table(f_xyz, skiprows=2, sep=r"\s+", names=["atom", "x", "y", "z"])
         coordinates = molecule[["x", "y", "z"]]
         lo = coordinates.min().min() - 0.5
         hi = coordinates.max().max() + 0.5
@@ -555,41 +611,26 @@ def ff_parser(ff_dir, xyz_dir):
         lines = lines_org.split("\n\n")
         atoms = "\n".join(lines[4].split("\n", 4)[4].split("\n")[:-1])
         dfs = dict()
-        dfs["atoms"] = pd.read_csv(
-            StringIO(atoms),
-            names=SECTION_SORTER.get("atoms").get("in_header"),
-            delim_whitespace=True,
-            usecols=[0, 4, 5, 6],
-        )
+        dfs["atoms"] = _section_frame(atoms, SECTION_SORTER.get("atoms").get("in_header"), usecols=[0, 4, 5, 6])
         dfs["atoms"] = pd.concat([dfs["atoms"], coordinates], axis=1)
         dfs["atoms"].index += 1
         dfs["atoms"].index.name = "type"
         dfs["atoms"] = dfs["atoms"].reset_index()
         dfs["atoms"].index += 1
-        types = dfs["atoms"].copy().reset_index().set_index("atom")["type"]
-        replace_dict = {
-            "atom1": dict(types),
-            "atom2": dict(types),
-            "atom3": dict(types),
-            "atom4": dict(types),
-        }
+        types_map = dict(zip(dfs["atoms"]["atom"], dfs["atoms"]["type"]))
         counts = dict()
         counts["atoms"] = len(dfs["atoms"].index)
-        mass_list = list()
-        for index, row in dfs["atoms"].iterrows():
-            mass_list.append(MM_of_Elements.get(re.split(r"(\d+)", row["atom"])[0]))
-        mass_df = pd.DataFrame(mass_list)
+        mass_list = [_atom_name_to_mass(atom) for atom in dfs["atoms"]["atom"].to_numpy()]
+        mass_df = pd.DataFrame(mass_list, columns=["mass"])
         mass_df.index += 1
-        mass_string = mass_df.to_string(header=False, index_names=False, float_format="{:.3f}".format)
+        mass_string = _table_string(mass_df, ["mass"], float_format="%.3f")
         masses = ["Masses", mass_string]
         ff = ["Pair Coeffs"]
         dfs["atoms"]["mol-id"] = 1
-        atom_ff_string = dfs["atoms"][SECTION_SORTER["atoms"]["ff_header"]].to_string(header=False, index_names=False)
+        atom_ff_string = _table_string(dfs["atoms"], SECTION_SORTER["atoms"]["ff_header"])
         ff.append(atom_ff_string)
         topo = ["Atoms"]
-        atom_topo_string = dfs["atoms"][SECTION_SORTER["atoms"]["topo_header"]].to_string(
-            header=False, index_names=False
-        )
+        atom_topo_string = _table_string(dfs["atoms"], SECTION_SORTER["atoms"]["topo_header"])
         topo.append(atom_topo_string)
         for section in list(SECTION_SORTER.keys())[1:]:
             if SECTION_SORTER[section]["in_kw"] in lines_org:
@@ -600,30 +641,23 @@ def ff_parser(ff_dir, xyz_dir):
                     SECTION_SORTER[section]["in_header"],
                 )
                 section_str = lines[a].split("\n", b)[b]
-                dfs[section] = pd.read_csv(
-                    StringIO(section_str),
-                    names=d,
-                    delim_whitespace=True,
-                    usecols=list(range(c)),
-                )
+                dfs[section] = _section_frame(section_str, d, usecols=range(c))
 
                 dfs[section].index += 1
                 dfs[section].index.name = "type"
-                dfs[section] = dfs[section].replace(replace_dict)
+                for col in d:
+                    if col.startswith("atom"):
+                        dfs[section][col] = dfs[section][col].map(types_map).astype(int)
                 dfs[section] = dfs[section].reset_index()
                 dfs[section].index += 1
                 if section == "impropers":
                     dfs[section]["v1"] = dfs[section]["v2"] / 2
                     dfs[section]["v2"] = -1
                     dfs[section]["v3"] = 2
-                ff_string = dfs[section][SECTION_SORTER[section]["ff_header"]].to_string(
-                    header=False, index_names=False
-                )
+                ff_string = _table_string(dfs[section], SECTION_SORTER[section]["ff_header"])
                 ff.append(SECTION_SORTER[section]["out_kw"][0])
                 ff.append(ff_string)
-                topo_string = dfs[section][SECTION_SORTER[section]["topo_header"]].to_string(
-                    header=False, index_names=False
-                )
+                topo_string = _table_string(dfs[section], SECTION_SORTER[section]["topo_header"])
                 topo.append(SECTION_SORTER[section]["out_kw"][1])
                 topo.append(topo_string)
                 counts[section] = len(dfs[section].index)
@@ -638,8 +672,15 @@ def ff_parser(ff_dir, xyz_dir):
             stats,
             BOX.format(lo, hi),
         ]
-        data_string = "\n\n".join(header + masses + ff + topo) + "\n"
-        return data_string
+        # write the sections one after another instead of concatenating the lists first
+        data_string = StringIO()
+        data_string.write("\n\n".join(header))
+        for sections in (masses, ff, topo):
+            for section in sections:
+                data_string.write("\n\n")
+                data_string.write(section)
+        data_string.write("\n")
+        return data_string.getvalue()
 
 
 def concentration_matcher(
@@ -697,24 +738,20 @@ def concentration_matcher(
             by a float of the approximate length of one side of the box in Å.
 
     """
-    n_solvent = list()
-    n = len(solv_ratio)
-    if n != len(solvents):
+    if len(solv_ratio) != len(solvents):
         raise ValueError("solvents and solv_ratio must be the same length!")
 
-    if isinstance(salt, float) or isinstance(salt, int):
+    if isinstance(salt, (float, int)):
         salt_molar_volume = salt
     elif isinstance(salt, Molecule):
         salt_molar_volume = molecular_volume(salt, salt.composition.reduced_formula, radii_type=radii_type)
     elif isinstance(salt, str):
-        if MOLAR_VOLUME.get(salt.lower()):
-            salt_molar_volume = MOLAR_VOLUME.get(salt.lower(), 0)
-        else:
+        salt_molar_volume = MOLAR_VOLUME.get(salt.lower())
+        if not salt_molar_volume:
             if not os.path.exists(salt):
                 print("\nError: Input file '{}' not found.\n".format(salt))
                 sys.exit(1)
-            name = os.path.splitext(os.path.split(salt)[-1])[0]
-            ext = os.path.splitext(os.path.split(salt)[-1])[1]
+            name, ext = os.path.splitext(os.path.split(salt)[-1])
             if not ext == ".xyz":
                 print("Error: Wrong file format, please use a .xyz file.\n")
                 sys.exit(1)
@@ -731,23 +768,15 @@ def concentration_matcher(
         else:
             solv_mass.append(MOLAR_MASS[ALIAS[solv.lower()]])
             solv_density.append(DENSITY[ALIAS[solv.lower()]])
+    ratio = np.asarray(solv_ratio, dtype=float)
+    solv_mass = np.asarray(solv_mass, dtype=float)
+    solv_density = np.asarray(solv_density, dtype=float)
     if mode.lower().startswith("v"):
-        for i in range(n):
-            n_solvent.append(solv_ratio[i] * solv_density[i] / solv_mass[i])
-        n_salt = 1 / (1000 / concentration - salt_molar_volume)
-        n_all = [int(m / n_salt * num_salt) for m in n_solvent]
-        n_all.insert(0, num_salt)
-        volume = ((1 + salt_molar_volume * n_salt) / n_salt * num_salt) / 6.022e23
-        return n_all, volume ** (1 / 3) * 1e8
+        n_solvent = ratio * solv_density / solv_mass
+        v_solv = 1
     elif mode.lower().startswith("w"):
-        for i in range(n):
-            n_solvent.append(solv_ratio[i] / solv_mass[i])
-        v_solv = np.divide(solv_ratio, solv_density).sum()
-        n_salt = v_solv / (1000 / concentration - salt_molar_volume)
-        n_all = [int(m / n_salt * num_salt) for m in n_solvent]
-        n_all.insert(0, num_salt)
-        volume = ((v_solv + salt_molar_volume * n_salt) / n_salt * num_salt) / 6.022e23
-        return n_all, volume ** (1 / 3) * 1e8
+        n_solvent = ratio / solv_mass
+        v_solv = (ratio / solv_density).sum()
     else:
         mode = input("Volume or weight ratio? (w or v): ")
         return concentration_matcher(
@@ -758,6 +787,10 @@ def concentration_matcher(
             num_salt=num_salt,
             mode=mode,
         )
+    n_salt = v_solv / (1000 / concentration - salt_molar_volume)
+    n_all = [num_salt] + (n_solvent / n_salt * num_salt).astype(int).tolist()
+    volume = ((v_solv + salt_molar_volume * n_salt) / n_salt * num_salt) / 6.022e23
+    return n_all, volume ** (1 / 3) * 1e8
 
 
 def sdf_to_pdb(sdf_file, pdb_file, write_title=True, remark4=True, credit=True, pubchem=True):
@@ -835,50 +868,33 @@ def sdf_to_pdb(sdf_file, pdb_file, write_title=True, remark4=True, credit=True,
             outp.write("REMARK   4      COMPLIES WITH FORMAT V. 3.3, 21-NOV-2012\n")
         if credit:
             outp.write("REMARK 888\n" "REMARK 888 WRITTEN BY MDGO (CREATED BY TINGZHENG HOU)\n")
-        for n in range(atoms):
-            line = pdb_atoms[n].copy()
-            if len(line["name"]) == 3:
-                line["name"] = " " + line["name"]
+        pdb_format = (
+            "{ATOM:<6s}{serial:>5d} {name:^4s}{altLoc:1s}{resName:>3s} {chainID:1s}{resSeq:>4.4}{iCode:1s}   "
+            "{x:>8.3f}{y:>8.3f}{z:>8.3f}{occupancy:>6.2f}{tempFactor:>6.2f}      "
+            "{segment:<4s}{element:>2s}{charge:<2s}\n"
+        )
+        atom_lines = list()
+        for line in pdb_atoms[:atoms]:
+            name = line["name"]
+            if len(name) == 3:
+                name = " " + name
             # format pdb
-            formatted_line = (
-                "{:<6s}{:>5d} {:^4s}{:1s}{:>3s} {:1s}{:>4.4}{:1s}   "
-                "{:>8.3f}{:>8.3f}{:>8.3f}{:>6.2f}{:>6.2f}      "
-                "{:<4s}{:>2s}{:<2s}"
-            ).format(
-                line["ATOM"],
-                line["serial"],
-                line["name"],
-                line["altLoc"],
-                line["resName"],
-                line["chainID"],
-                str(line["resSeq"]),
-                line["iCode"],
-                line["x"],
-                line["y"],
-                line["z"],
-                line["occupancy"],
-                line["tempFactor"],
-                line["segment"],
-                line["element"],
-                line["charge"],
-            )
-            # write
-            outp.write(formatted_line + "\n")
+            atom_lines.append(pdb_format.format(**dict(line, name=name, resSeq=str(line["resSeq"]))))
+        outp.write("".join(atom_lines))
 
         bond_lines = [[i] for i in range(atoms + 1)]
-        for i, atom in enumerate(atom1s):
-            bond_lines[atom].append(atom2s[i])
-        for i, atom in enumerate(atom2s):
-            bond_lines[atom].append(atom1s[i])
-        for i in range(len(orders)):
-            for j, line in enumerate(bond_lines):
-                if line[0] == orders[i][0]:
-                    bond_lines.insert(j + 1, orders[i])
-                    break
-        for i in range(1, len(bond_lines)):
-            bond_lines[i][1:] = sorted(bond_lines[i][1:])
-        for i in range(1, len(bond_lines)):
-            outp.write("CONECT" + "".join("{:>5d}".format(num) for num in bond_lines[i]) + "\n")
+        for atom1, atom2 in zip(atom1s, atom2s):
+            bond_lines[atom1].append(atom2)
+            bond_lines[atom2].append(atom1)
+        # the extra lines of the multiple bonds follow the line of their first atom, latest first
+        order_lines = defaultdict(list)
+        for order in orders:
+            order_lines[order[0]].append(order)
+        conect_lines = list()
+        for line in bond_lines[1:]:
+            conect_lines.append([line[0]] + sorted(line[1:]))
+            conect_lines.extend(reversed(order_lines[line[0]]))
+        outp.write("".join("CONECT" + "".join("{:>5d}".format(num) for num in line) + "\n" for line in conect_lines))
         outp.write("END\n")  # final 'END'
 
 
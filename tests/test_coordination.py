@@ -1,10 +1,267 @@
-import os
 import unittest
 
+import numpy as np
+import MDAnalysis
+from MDAnalysis.coordinates.memory import MemoryReader
+from MDAnalysis.lib.distances import distance_array
+from numpy.testing import assert_allclose, assert_array_equal
 
-class MyTestCase(unittest.TestCase):
-    def test_something(self):
-        self.assertEqual(True, False)
+from mdgo.coordination import (
+    _distances_to,
+    _mic_distances,
+    _mic_distances_loop,
+    _mic_distances_numpy,
+    _hopping_sites,
+    _hopping_in_out,
+    check_contiguous_steps,
+    coord_shell_array,
+    find_in_n_out,
+    find_nearest,
+    heat_map,
+    num_of_neighbor_one_li,
+    num_of_neighbor_all_li,
+    num_of_neighbor_one_li_complex,
+    trajectory,
+)
+
+
+def _kernels(func):
+    # the plain python function as well as the numba compiled one, if any
+    return [func, func.py_func] if hasattr(func, "py_func") else [func]
+
+
+class HoppingKernelTest(unittest.TestCase):
+    def setUp(self):
+        # atom 0 leaves the shell at step 3, atom 1 enters at step 4
+        self.dist_matrix = np.array(
+            [
+                [2.0, 2.0, 2.0, 4.0, 4.0, 4.0, 4.0, 4.0],
+                [4.0, 4.0, 4.0, 4.0, 2.0, 2.0, 2.0, 2.0],
+            ]
+        )
+        self.nearest = np.argmin(self.dist_matrix, axis=0)
+
+    def test_hopping_sites(self):
+        for hopping_sites in _kernels(_hopping_sites):
+            site_rows, site_distance = hopping_sites(self.dist_matrix, self.nearest, 2.5, 3.0)
+            assert_array_equal(site_rows, [0, 0, 0, -1, 1, 1, 1, 1])
+            assert_array_equal(site_distance, [2.0, 2.0, 2.0, 100.0, 2.0, 2.0, 2.0, 2.0])
+
+    def test_hopping_sites_cutoff(self):
+        # within the hopping cutoff the old site is kept even if another one is closer
+        dist_matrix = np.array([[2.0, 2.8, 2.8, 3.5], [4.0, 2.2, 2.2, 2.2]])
+        for hopping_sites in _kernels(_hopping_sites):
+            site_rows, site_distance = hopping_sites(dist_matrix, np.argmin(dist_matrix, axis=0), 2.5, 3.0)
+            assert_array_equal(site_rows, [0, 0, 0, 1])
+            assert_array_equal(site_distance, [2.0, 2.8, 2.8, 2.2])
+
+    def test_hopping_in_out(self):
+        site_rows = np.array([0, 0, 0, -1, 1, 1, 1, 1])
+        for hopping_in_out in _kernels(_hopping_in_out):
+            steps_in, steps_out = hopping_in_out(site_rows, 0)
+            assert_array_equal(steps_in, [4])
+            assert_array_equal(steps_out, [3])
+            # a hopping out followed by a hopping in within the cool down is dropped
+            steps_in, steps_out = hopping_in_out(site_rows, 2)
+            assert_array_equal(steps_in, [4])
+            assert_array_equal(steps_out, [])
+
+    def test_hopping_in_out_cool_down(self):
+        # a hopping in followed by a hopping out within the cool down is dropped
+        site_rows = np.array([-1, -1, 0, 0, 0, 0, -1, -1, -1, -1, 1, -1])
+        for hopping_in_out in _kernels(_hopping_in_out):
+            steps_in, steps_out = hopping_in_out(site_rows, 3)
+            assert_array_equal(steps_in, [2])
+            assert_array_equal(steps_out, [6, 11])
+
+
+class DistancesToTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        # points outside of the box as well, so that the minimum image matters
+        self.ref = rng.uniform(0, 20, size=3).astype(np.float32)
+        self.points = rng.uniform(-30, 50, size=(50, 3)).astype(np.float32)
+
+    def test_orthorhombic(self):
+        dimensions = np.array([20, 22, 25, 90, 90, 90], dtype=np.float32)
+        assert_allclose(
+            _distances_to(self.ref, self.points, dimensions),
+            distance_array(self.ref, self.points, dimensions)[0],
+            rtol=1e-5,
+        )
+
+    def test_triclinic(self):
+        dimensions = np.array([20, 22, 25, 80, 95, 100], dtype=np.float32)
+        assert_allclose(
+            _distances_to(self.ref, self.points, dimensions),
+            distance_array(self.ref, self.points, dimensions)[0],
+            rtol=1e-5,
+        )
+
+    def test_kernels_agree(self):
+        # the numba kernel, if any, gives the same distances as the numpy fallback
+        box = np.array([20, 22, 25], dtype=np.float32)
+        expected = _mic_distances_numpy(self.ref, self.points, box)
+        for mic_distances in _kernels(_mic_distances) + [_mic_distances_loop]:
+            assert_array_equal(mic_distances(self.ref, self.points, box), expected)
+
+    def test_no_box(self):
+        assert_allclose(
+            _distances_to(self.ref, self.points, None),
+            distance_array(self.ref, self.points)[0],
+            rtol=1e-5,
+        )
+
+
+def _line_universe():
+    # a cation (type 1) fixed at x = 5 and three solvent atoms (type 3) moving along the x axis
+    u = MDAnalysis.Universe.empty(4, n_residues=4, atom_resindex=[0, 1, 2, 3], trajectory=True)
+    u.add_TopologyAttr("type", ["1", "3", "3", "3"])
+    u.add_TopologyAttr("id", [1, 2, 3, 4])
+    u.add_TopologyAttr("resid", [1, 2, 3, 4])
+    x = np.array([[5, 7, 15, 25], [5, 7, 15, 25], [5, 8, 8, 25], [5, 12, 8, 25]], dtype=np.float32)
+    coords = np.full((4, 4, 3), 5.0, dtype=np.float32)
+    coords[:, :, 0] = x
+    dimensions = np.tile([30, 30, 30, 90, 90, 90], (4, 1)).astype(np.float32)
+    u.load_new(coords, format=MemoryReader, dimensions=dimensions)
+    return u
+
+
+class TrajectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.u = _line_universe()
+        self.select_dict = {"solvent": "type 3", "all": "all"}
+
+    def test_trajectory(self):
+        trj = trajectory(self.u, self.u.atoms[0], 0, 4, "solvent", self.select_dict, 3.5)
+        # in the order of entering the shell, with the distances over the whole run
+        self.assertEqual(list(trj), ["2", "3"])
+        assert_allclose(trj["2"], [2, 2, 3, 7])
+        assert_allclose(trj["3"], [10, 10, 3, 3])
+        # the central atom is never its own neighbor
+        trj_all = trajectory(self.u, self.u.atoms[0], 0, 4, "all", self.select_dict, 3.5)
+        self.assertEqual(list(trj_all), ["2", "3"])
+        self.assertIsNone(trajectory(self.u, self.u.atoms[0], 0, 4, "anion", self.select_dict, 3.5))
+
+    def test_check_contiguous_steps(self):
+        # 1, 1, 2 and 1 solvent atoms in the shell on the four steps
+        coord_num = check_contiguous_steps(
+            self.u, self.u.atoms[0], {"solvent": 3.5}, self.select_dict, 0, 4, np.array([2]), lag=1
+        )
+        assert_allclose(coord_num["solvent"], [1, 2, 1])
+        # the window of a checkpoint is cut at the ends of the run
+        coord_num = check_contiguous_steps(
+            self.u, self.u.atoms[0], {"solvent": 3.5}, self.select_dict, 0, 4, np.array([0, 3]), lag=1
+        )
+        assert_allclose(coord_num["solvent"], [2, 1, 1])
+
+    def test_heat_map_unbound(self):
+        coords = heat_map(self.u, self.u.atoms[0], [0, 0, 0, 0], 3.5, "type 3", np.eye(3), 0, 4)
+        self.assertEqual(coords.shape, (0, 3))
+
+
+class FindNearestTest(unittest.TestCase):
+    @staticmethod
+    def _trj():
+        # a window of 3 with a second order filter does not change the distances
+        return {
+            "5": np.array([2.0, 1.5, 2.2, 4.0, 4.0, 4.0, 4.0, 4.0]),
+            "9": np.array([4.0, 4.0, 4.0, 4.0, 2.4, 1.8, 2.0, 2.0]),
+        }
+
+    def test_find_nearest(self):
+        sites, frequency, steps = find_nearest(self._trj(), 1, 2.5, 3.0, smooth=3)
+        assert_array_equal(sites, [5, 5, 5, 0, 9, 9, 9, 9])
+        self.assertAlmostEqual(frequency, 1 / 8)
+        self.assertEqual(steps, [1, 5])
+
+    def test_find_in_n_out(self):
+        steps_in, steps_out = find_in_n_out(self._trj(), 2.5, 3.0, smooth=3, cool=0)
+        self.assertEqual(steps_in, [4])
+        self.assertEqual(steps_out, [3])
+        steps_in, steps_out = find_in_n_out(self._trj(), 2.5, 3.0, smooth=3, cool=2)
+        self.assertEqual(steps_in, [4])
+        self.assertEqual(steps_out, [])
+
+
+def _random_walk_universe(n_frames=40, box=20.0, seed=0):
+    # 6 cations (type 1), 4 anions of 3 atoms (type 2) and 10 solvents of 2 atoms (type 3)
+    rng = np.random.default_rng(seed)
+    types = ["1"] * 6 + ["2"] * 12 + ["3"] * 20
+    resindices = list(range(6)) + [6 + i // 3 for i in range(12)] + [10 + i // 2 for i in range(20)]
+    u = MDAnalysis.Universe.empty(len(types), n_residues=20, atom_resindex=resindices, trajectory=True)
+    u.add_TopologyAttr("type", types)
+    u.add_TopologyAttr("id", list(range(1, len(types) + 1)))
+    u.add_TopologyAttr("resid", list(range(1, 21)))
+    start = rng.uniform(0, box, size=(1, len(types), 3))
+    steps = rng.normal(0, 0.6, size=(n_frames, len(types), 3)).cumsum(axis=0)
+    coords = ((start + steps) % box).astype(np.float32)
+    dimensions = np.tile([box, box, box, 90, 90, 90], (n_frames, 1)).astype(np.float32)
+    u.load_new(coords, format=MemoryReader, dimensions=dimensions)
+    return u
+
+
+class NeighborCountTest(unittest.TestCase):
+    def test_all_li_matches_one_li(self):
+        u = _random_walk_universe()
+        select_dict = {"cation": "type 1", "anion": "type 2", "solvent": "type 3"}
+        li_atoms = u.select_atoms(select_dict["cation"])
+        # the cation species also checks that the central atom is never counted
+        species_dict = {"anion": 4.0, "solvent": 3.0, "cation": 6.0}
+        one_li = coord_shell_array(u, num_of_neighbor_one_li, li_atoms, species_dict, select_dict, 0, 40)
+        all_li = num_of_neighbor_all_li(u, li_atoms, species_dict, select_dict, 0, 40)
+        self.assertEqual(list(all_li), list(one_li))
+        for kw in ["anion", "solvent", "cation", "total"]:
+            assert_array_equal(all_li[kw], one_li[kw])
+        self.assertTrue(all_li["total"].any())
+
+
+def _chain_universe():
+    # cations 0, 1, 2 (type 1) and two anions of 2 atoms (type 2) along the x axis
+    types = ["1"] * 3 + ["2"] * 4
+    u = MDAnalysis.Universe.empty(7, n_residues=5, atom_resindex=[0, 1, 2, 3, 3, 4, 4], trajectory=True)
+    u.add_TopologyAttr("type", types)
+    u.add_TopologyAttr("id", list(range(1, 8)))
+    u.add_TopologyAttr("resid", list(range(1, 6)))
+    x = np.array(
+        [
+            # center, anion 1, cation 2, anion 3 and cation 4 in a chain; the contacts are
+            # within 2.5 and the other cation-anion pairs beyond 3.5, clear of the 3.0 cutoff
+            [5, 9.5, 14, 7, 7.5, 11.5, 12],
+            # the last cation leaves
+            [5, 9.5, 25, 7, 7.5, 11.5, 12],
+            # the first anion leaves as well
+            [5, 9.5, 25, 20, 20.5, 11.5, 12],
+        ],
+        dtype=np.float32,
+    )
+    coords = np.full((3, 7, 3), 5.0, dtype=np.float32)
+    coords[:, :, 0] = x
+    dimensions = np.tile([30, 30, 30, 90, 90, 90], (3, 1)).astype(np.float32)
+    u.load_new(coords, format=MemoryReader, dimensions=dimensions)
+    return u
+
+
+class ComplexShellTest(unittest.TestCase):
+    def setUp(self):
+        self.u = _chain_universe()
+        self.select_dict = {"cation": "type 1", "anion": "type 2"}
+
+    def test_shell_counts(self):
+        # both atoms of the first anion are within the cutoff, but the residue is counted once
+        cn_values = num_of_neighbor_one_li_complex(self.u, self.u.atoms[0], "anion", self.select_dict, 3.5, 0, 3)
+        assert_array_equal(cn_values, [[1, 1, 1, 1], [1, 1, 1, 0], [0, 0, 0, 0]])
+
+    def test_contact_distance(self):
+        # no cation-anion contact is shorter than 2.0, so only the first shell is left
+        cn_values = num_of_neighbor_one_li_complex(
+            self.u, self.u.atoms[0], "anion", self.select_dict, 3.5, 0, 3, contact_distance=1.5
+        )
+        assert_array_equal(cn_values, [[1, 0, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0]])
+
+    def test_missing_cation(self):
+        with self.assertRaises(ValueError):
+            num_of_neighbor_one_li_complex(self.u, self.u.atoms[0], "anion", {"anion": "type 2"}, 3.5, 0, 3)
 
 
 if __name__ == "__main__":
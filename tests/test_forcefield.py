@@ -3,7 +3,10 @@ import sys
 import tempfile
 from io import StringIO
 import unittest
+from unittest import mock
+from pandas.testing import assert_frame_equal
 from mdgo.forcefield import *
+from mdgo.forcefield import _load_data_model
 
 test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files")
 
@@ -30,5 +33,111 @@ class FFcrawlerTest(unittest.TestCase):
             shutil.rmtree(download_dir)
 
 
+class _RecordingCrawler(FFcrawler):
+    # records the sessions and the files without starting a browser
+    def __init__(self, write_dir, chromedriver_dir=None, **kwargs):
+        self.keep_open = False
+        self.files = []
+        self.sessions.append(self)
+
+    def quit(self):
+        pass
+
+    def data_from_pdb(self, pdb_dir):
+        self.files.append(pdb_dir)
+
+
+class DataFromPdbsTest(unittest.TestCase):
+    def setUp(self):
+        _RecordingCrawler.sessions = []
+
+    def test_more_workers_than_files(self):
+        _RecordingCrawler.data_from_pdbs("/tmp", ["a.pdb", "b.pdb"], n_workers=8)
+        self.assertEqual(len(_RecordingCrawler.sessions), 2)
+        self.assertEqual(sorted(f for lpg in _RecordingCrawler.sessions for f in lpg.files), ["a.pdb", "b.pdb"])
+
+    def test_chunks(self):
+        _RecordingCrawler.data_from_pdbs("/tmp", ["a.pdb", "b.pdb", "c.pdb"], n_workers=2)
+        self.assertEqual(sorted(lpg.files for lpg in _RecordingCrawler.sessions), [["a.pdb", "c.pdb"], ["b.pdb"]])
+
+    def test_invalid_workers(self):
+        with self.assertRaises(ValueError):
+            _RecordingCrawler.data_from_pdbs("/tmp", ["a.pdb"], n_workers=0)
+        _RecordingCrawler.data_from_pdbs("/tmp", [], n_workers=2)
+        self.assertEqual(_RecordingCrawler.sessions, [])
+
+
+class PubChemRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.write_dir = tempfile.mkdtemp()
+        self.pcr = PubChemRunner(self.write_dir, None, api=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.write_dir)
+
+    def test_web_entry_without_browser(self):
+        # a name PUG REST knows is resolved without importing selenium
+        with mock.patch.object(PubChemRunner, "_search_rest", return_value=("7303", "C1COC(=O)O1")), mock.patch(
+            "mdgo.forcefield._selenium", side_effect=ImportError
+        ) as selenium:
+            cid = self.pcr.obtain_entry("ethylene carbonate", "EC", output_format="smiles")
+        self.assertEqual(cid, "7303")
+        selenium.assert_not_called()
+
+    def test_molecular_weights(self):
+        pcp = mock.Mock()
+        pcp.get_properties.return_value = [
+            {"CID": 7303, "MolecularWeight": "88.06"},
+            {"CID": 7924, "MolecularWeight": "102.09"},
+        ]
+        with mock.patch.dict(sys.modules, {"pubchempy": pcp}):
+            self.assertEqual(self.pcr.molecular_weights(["7303", 7924]), {7303: 88.06, 7924: 102.09})
+            pcp.get_properties.assert_called_once_with("MolecularWeight", [7303, 7924])
+            # no request for an empty list
+            self.assertEqual(self.pcr.molecular_weights([]), {})
+            pcp.get_properties.assert_called_once()
+
+
+def _assert_data_equal(data1, data2):
+    # compares the parsed sections rather than a serialized string, which pymatgen no longer provides
+    assert_frame_equal(data1.masses, data2.masses)
+    assert_frame_equal(data1.atoms, data2.atoms)
+    force_field1, force_field2 = data1.force_field or {}, data2.force_field or {}
+    assert list(force_field1) == list(force_field2)
+    for kw in force_field1:
+        assert_frame_equal(force_field1[kw], force_field2[kw])
+
+
+class AqueousTest(unittest.TestCase):
+    def test_get_water(self):
+        _assert_data_equal(Aqueous.get_water(), Aqueous.get_water("SPC/E"))
+        _assert_data_equal(
+            Aqueous.get_water("tip3p-ew"), LammpsData.from_file(os.path.join(DATA_DIR, "water", "water_tip3p_ew.lmp"))
+        )
+        self.assertIsNone(Aqueous.get_water("tip5p"))
+
+    def test_get_ion(self):
+        li = LammpsData.from_file(os.path.join(DATA_DIR, "ion", "jensen_jorgensen", "Li+.lmp"))
+        for model in ["jj", "JJ", "jensen_jorgensen"]:
+            _assert_data_equal(Aqueous.get_ion(model=model, ion="li+"), li)
+        na = LammpsData.from_file(os.path.join(DATA_DIR, "ion", "joung_cheatham", "spce", "Na+.lmp"))
+        _assert_data_equal(Aqueous.get_ion(model="jc", water="spce", ion="Na+"), na)
+        _assert_data_equal(Aqueous.get_ion(model="aq", ion="K+"), Aqueous.get_ion("aqvist", ion="k+"))
+        self.assertIsNone(Aqueous.get_ion(model="opls"))
+        self.assertIsNone(Aqueous.get_ion(model="jc", water="default"))
+        self.assertIsNone(Aqueous.get_ion(model="aq", ion="Xe+"))
+
+    def test_cached_copies(self):
+        # the returned data files can be modified without changing the cached ones
+        spce = Aqueous.get_water()
+        spce.masses.loc[1, "mass"] = 99.0
+        spce.atoms["q"] = 0.0
+        self.assertEqual(Aqueous.get_water().masses.loc[1, "mass"], 1.00794)
+        cached = _load_data_model(os.path.join(DATA_DIR, "water", "water_spce.lmp"))
+        self.assertEqual(cached.masses.loc[1, "mass"], 1.00794)
+        self.assertTrue(cached.atoms["q"].any())
+        self.assertIsNot(Aqueous.get_ion(), Aqueous.get_ion())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,286 @@
 import os
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
+import pandas as pd
+import MDAnalysis
+from MDAnalysis.coordinates.memory import MemoryReader
+from numpy.testing import assert_allclose
+from pymatgen.io.lammps.data import CombinedData, LammpsData
 
-class MyTestCase(unittest.TestCase):
-    def test_something(self):
-        self.assertEqual(True, False)
+from mdgo.util import (
+    atom_vec,
+    atom_vecs,
+    concentration_matcher,
+    extract_atom_from_ion,
+    ff_parser,
+    mass_to_name,
+    position_vec,
+    position_vec_batch,
+    res_dict_from_lammpsdata,
+    res_dict_from_select_dict,
+    sdf_to_pdb,
+    _table_string,
+)
+
+test_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files")
+ion_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mdgo", "data", "ion")
+
+
+def _branch_vec(pos1, pos2, dimension):
+    # the per-axis minimum image vector as atom_vec used to compute it
+    vec = [0, 0, 0]
+    for i in range(3):
+        diff = pos1[i] - pos2[i]
+        if diff > dimension[i] / 2:
+            vec[i] = diff - dimension[i]
+        elif diff < -dimension[i] / 2:
+            vec[i] = diff + dimension[i]
+        else:
+            vec[i] = diff
+    return np.array(vec)
+
+
+class MinimumImageTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.dimensions = np.array([12.0, 15.0, 20.0, 90.0, 90.0, 90.0])
+        self.u = MDAnalysis.Universe.empty(20, trajectory=True)
+        self.u.load_new(
+            rng.uniform(0, 1, size=(1, 20, 3)) * self.dimensions[:3],
+            format=MemoryReader,
+            dimensions=self.dimensions,
+        )
+        self.atoms1 = self.u.atoms[:10]
+        self.atoms2 = self.u.atoms[10:]
+        self.expected = np.array(
+            [_branch_vec(a.position, b.position, self.dimensions) for a, b in zip(self.atoms1, self.atoms2)]
+        )
+
+    def test_position_vec_batch(self):
+        vecs = position_vec_batch(self.atoms1.positions, self.atoms2.positions, self.dimensions)
+        self.assertEqual(vecs.shape, (10, 3))
+        assert_allclose(vecs, self.expected, atol=1e-5)
+        # every vector is within half a box length on each axis
+        self.assertTrue(np.all(np.abs(vecs) <= self.dimensions[:3] / 2))
+
+    def test_position_vec(self):
+        for a, b, expected in zip(self.atoms1, self.atoms2, self.expected):
+            assert_allclose(position_vec(a.position, b.position, self.dimensions), expected, atol=1e-5)
+            assert_allclose(atom_vec(a, b, self.dimensions), expected, atol=1e-5)
+
+    def test_atom_vecs_atom_group(self):
+        assert_allclose(atom_vecs(self.atoms1, self.atoms2, self.dimensions), self.expected, atol=1e-5)
+
+    def test_atom_vecs_list(self):
+        vecs = atom_vecs(list(self.atoms1), list(self.atoms2), self.dimensions)
+        assert_allclose(vecs, self.expected, atol=1e-5)
+
+    def test_atom_vecs_single_atom(self):
+        center = self.atoms2[0]
+        expected = np.array([_branch_vec(a.position, center.position, self.dimensions) for a in self.atoms1])
+        vecs = atom_vecs(self.atoms1, center, self.dimensions)
+        self.assertEqual(vecs.shape, (10, 3))
+        assert_allclose(vecs, expected, atol=1e-5)
+
+
+def _data_sections(data_string):
+    # the rows of each titled section of a LAMMPS data string, as floats
+    blocks = data_string.strip("\n").split("\n\n")
+    return {
+        title: np.array([line.split() for line in body.split("\n")], dtype=float)
+        for title, body in zip(blocks[:-1], blocks[1:])
+        if title[0].isalpha() and not title.startswith("LAMMPS")
+    }
+
+
+class TableStringTest(unittest.TestCase):
+    def test_table_string(self):
+        df = pd.DataFrame({"type": [3, 1], "k": [570.0, 0.5], "r0": [1.229, 1.0]}, index=[1, 2])
+        self.assertEqual(_table_string(df, ["type", "k", "r0"]), "1 3 570 1.229\n2 1 0.5 1")
+        self.assertEqual(_table_string(df, ["k"], float_format="%.3f"), "1 570.000\n2 0.500")
+
+    def test_table_string_precision(self):
+        # force field parameters with more than 6 decimals are not truncated
+        df = pd.DataFrame({"k": [0.12345678901, -1.5e-8]}, index=[1, 2])
+        self.assertEqual(_table_string(df, ["k"]), "1 0.123456789\n2 -1.5e-08")
+
+
+class FFParserTest(unittest.TestCase):
+    def setUp(self):
+        self.data = ff_parser(
+            os.path.join(test_dir, "formic_acid.out"),
+            os.path.join(test_dir, "formic_acid.xyz"),
+        )
+        self.sections = _data_sections(self.data)
+
+    def test_header(self):
+        for count in ["5  atoms", "4  bonds", "4  angles", "2  dihedrals", "1  impropers", "5  atom types"]:
+            self.assertIn(count, self.data)
+        self.assertIn("-1.531000 2.683000 xlo xhi", self.data)
+
+    def test_atoms(self):
+        assert_allclose(self.sections["Masses"], [[1, 12.011], [2, 15.999], [3, 15.999], [4, 1.008], [5, 1.008]])
+        assert_allclose(
+            self.sections["Pair Coeffs"],
+            [[1, 0.105, 3.75], [2, 0.21, 2.96], [3, 0.17, 3.0], [4, 0.015, 2.42], [5, 0.0, 0.0]],
+        )
+        assert_allclose(
+            self.sections["Atoms"][:, :4], [[i, 1, i, q] for i, q in enumerate([0.52, -0.44, -0.53, 0, 0.45], 1)]
+        )
+        assert_allclose(self.sections["Atoms"][1, 4:], [1.142, 0.821, 0.0])
+
+    def test_bonds(self):
+        assert_allclose(
+            self.sections["Bond Coeffs"],
+            [[1, 570.0, 1.229], [2, 450.0, 1.364], [3, 340.0, 1.09], [4, 553.0, 0.945]],
+        )
+        assert_allclose(self.sections["Bonds"], [[1, 1, 1, 2], [2, 2, 1, 3], [3, 3, 1, 4], [4, 4, 3, 5]])
+
+    def test_angles(self):
+        assert_allclose(
+            self.sections["Angle Coeffs"],
+            [[1, 80.0, 121.0], [2, 35.0, 123.0], [3, 40.0, 115.0], [4, 35.0, 113.0]],
+        )
+        assert_allclose(self.sections["Angles"], [[1, 1, 2, 1, 3], [2, 2, 2, 1, 4], [3, 3, 3, 1, 4], [4, 4, 1, 3, 5]])
+
+    def test_dihedrals(self):
+        assert_allclose(self.sections["Dihedral Coeffs"], [[1, 0.0, 5.5, 0.0, 0.0], [2, 0.0, 5.5, 0.0, 0.0]])
+        assert_allclose(self.sections["Dihedrals"], [[1, 1, 2, 1, 3, 5], [2, 2, 4, 1, 3, 5]])
+
+    def test_impropers(self):
+        # the V2 of Maestro is split into the K, d and n of the cvff style
+        assert_allclose(self.sections["Improper Coeffs"], [[1, 10.5, -1, 2]])
+        assert_allclose(self.sections["Impropers"], [[1, 1, 3, 4, 1, 2]])
+
+
+class MassToNameTest(unittest.TestCase):
+    def test_mass_to_name(self):
+        df = pd.DataFrame({"mass": [1.008, 12.011, 15.999, 0.0, 500.0]}, index=[1, 2, 3, 4, 5])
+        # unmatched masses are left out
+        self.assertEqual(mass_to_name(df), {1: "H", 2: "C", 3: "O", 4: "ZERO"})
+
+    def test_mass_to_name_duplicates(self):
+        # when several elements match, the last one in MM_of_Elements wins, as in the original loop
+        df = pd.DataFrame({"mass": [247.0703, 208.98, 281.0]}, index=[3, 1, 2])
+        self.assertEqual(mass_to_name(df), {3: "Bk", 1: "Po", 2: "Rg"})
+
+
+class ConcentrationMatcherTest(unittest.TestCase):
+    # the expected values were computed with the original per-solvent loops
+
+    def test_volume_ratio(self):
+        n_all, box_len = concentration_matcher(1.0, "lipf6", ["ec", "emc"], [3, 7], num_salt=100, mode="v")
+        self.assertEqual(n_all, [100, 4419, 6646])
+        self.assertAlmostEqual(box_len, 54.965023283403426)
+
+    def test_weight_ratio(self):
+        n_all, box_len = concentration_matcher(1.083, "litfsi", ["EC", "EMC"], [0.3, 0.7], num_salt=166, mode="w")
+        self.assertEqual(n_all, [166, 504, 996])
+        self.assertAlmostEqual(box_len, 63.37426858321185)
+
+    def test_custom_solvent(self):
+        water = {"mass": 18.01528, "density": 0.99707}
+        for mode in ["v", "w"]:
+            n_all, box_len = concentration_matcher(2.0, 50, [water], [1], num_salt=50, mode=mode)
+            self.assertEqual(n_all, [50, 1245])
+            self.assertAlmostEqual(box_len, 34.6257949213609)
+            self.assertEqual(concentration_matcher(2.0, 50, ["h2o"], [1], num_salt=50, mode=mode), (n_all, box_len))
+
+    def test_length_mismatch(self):
+        with self.assertRaises(ValueError):
+            concentration_matcher(1.0, "lipf6", ["ec", "emc"], [1])
+
+
+class SdfToPdbTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.pdb_file = os.path.join(self.tmp_dir, "acetonitrile.pdb")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sdf_to_pdb(self):
+        # the expected file was written by the original sdf_to_pdb, with a triple bond
+        # and bonds listed out of order in the sdf file
+        sdf_to_pdb(os.path.join(test_dir, "acetonitrile.sdf"), self.pdb_file)
+        with open(self.pdb_file) as f, open(os.path.join(test_dir, "acetonitrile.pdb")) as expected:
+            self.assertEqual(f.read(), expected.read())
+
+    def test_sdf_to_pdb_no_header(self):
+        sdf_to_pdb(
+            os.path.join(test_dir, "acetonitrile.sdf"), self.pdb_file, write_title=False, remark4=False, credit=False
+        )
+        with open(self.pdb_file) as f, open(os.path.join(test_dir, "acetonitrile.pdb")) as expected:
+            self.assertEqual(f.read(), "".join(expected.readlines()[4:]))
+
+
+def _ion_universe():
+    # a Li+ ion and a PF6- ion
+    u = MDAnalysis.Universe.empty(8, n_residues=2, atom_resindex=[0] + [1] * 7)
+    u.add_TopologyAttr("type", ["1", "7"] + ["8"] * 6)
+    u.add_TopologyAttr("name", ["Li", "P1"] + ["F" + str(i) for i in range(1, 7)])
+    u.add_TopologyAttr("charges", [1.0, 1.34] + [-0.39] * 6)
+    return u
+
+
+def _electrolyte_universe(salt=False):
+    # a Li+, a PF6- and an EC-like residue of two types, optionally with the ions in one residue
+    resindices = [0] + [0 if salt else 1] * 7 + [2, 2]
+    u = MDAnalysis.Universe.empty(10, n_residues=3, atom_resindex=resindices)
+    u.add_TopologyAttr("type", ["1", "7"] + ["8"] * 6 + ["3", "4"])
+    u.add_TopologyAttr("resid", [1, 2, 3])
+    return u
+
+
+class ResDictTest(unittest.TestCase):
+    def test_res_dict_from_select_dict(self):
+        select_dict = {"cation": "type 1", "anion": "type 7", "anion_F18": "type 8", "EC": "type 3", "EC-O": "type 4"}
+        res_dict = res_dict_from_select_dict(_electrolyte_universe(), select_dict)
+        # only the first selection of each residue is kept
+        self.assertEqual(
+            res_dict,
+            {"cation": "same resid as (type 1)", "anion": "same resid as (type 7)", "EC": "same resid as (type 3)"},
+        )
+
+    def test_res_dict_from_select_dict_salt(self):
+        select_dict = {"cation": "type 1", "anion": "type 7", "EC": "type 3"}
+        res_dict = res_dict_from_select_dict(_electrolyte_universe(salt=True), select_dict)
+        self.assertEqual(res_dict, {"EC": "same resid as (type 3)", "salt": "same resid as (type 1)"})
+
+    def test_res_dict_from_lammpsdata(self):
+        ions = [LammpsData.from_file(os.path.join(ion_dir, "jensen_jorgensen", ion + ".lmp")) for ion in ["Li+", "Na+"]]
+        coordinates = pd.DataFrame(np.zeros((5, 3)), columns=["x", "y", "z"], index=range(1, 6))
+        data = CombinedData(ions, ["li", "na"], [3, 2], coordinates)
+        self.assertEqual(res_dict_from_lammpsdata(data), {"li": "resid 1-3", "na": "resid 4-5"})
+        # a species of several fragments is selected by the masses of each fragment,
+        # and takes one resid per fragment and molecule
+        data.names, data.nums = ["li", "na", "k"], [2, 3, 4]
+        data.frags = [1, 2, 1]
+        self.assertEqual(
+            res_dict_from_lammpsdata(data),
+            {
+                "li": "resid 1-2",
+                "naa": "same mass as resid 3",
+                "nab": "same mass as resid 4",
+                "k": "resid 9-12",
+            },
+        )
+
+
+class ExtractAtomTest(unittest.TestCase):
+    def test_extract_atom_from_ion(self):
+        u = _ion_universe()
+        select_dict = dict()
+        extract_atom_from_ion(True, u.residues[0], select_dict)
+        self.assertEqual(select_dict, {"cation": "type 1"})
+        # the least common type selects the ion, the most negative atom is its center
+        for _ in range(2):
+            select_dict = dict()
+            extract_atom_from_ion(False, u.residues[1], select_dict)
+            self.assertEqual(select_dict, {"anion_F18": "type 8", "anion": "type 7"})
 
 
 if __name__ == "__main__":